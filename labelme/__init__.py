@@ -1 +1,6 @@
+import time
+
+# When the package was first imported, to time startup from.
+startTime = time.time()
+
 from labelme import utils
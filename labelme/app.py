@@ -24,6 +24,7 @@ import os.path
 import re
 import sys
 import subprocess
+import time
 
 from functools import partial
 from collections import defaultdict
@@ -38,16 +39,22 @@ except ImportError:
     from PyQt4.QtCore import *
     PYQT5 = False
 
-from labelme import resources
-from labelme.lib import struct, newAction, newIcon, addActions, fmtShortcut
+from labelme import resources, startTime
+from labelme.lib import struct, newAction, newButton, newIcon, addActions,\
+        fmtShortcut
 from labelme.shape import Shape, DEFAULT_LINE_COLOR, DEFAULT_FILL_COLOR
 from labelme.canvas import Canvas
 from labelme.zoomWidget import ZoomWidget
 from labelme.labelDialog import LabelDialog
 from labelme.colorDialog import ColorDialog
 from labelme.labelFile import LabelFile, LabelFileError
+from labelme.binaryLabelFile import BinaryLabelFile
 from labelme.correspondenceFile import CorrespondenceFile, CorrespondenceFileError
+from labelme.editJournal import EditJournal
 from labelme.toolBar import ToolBar
+from labelme.worker import Worker
+from labelme.imageLoader import ImageLoadError, Prefetcher, imageCache,\
+        imageFiles, labelFileType, loadImageFile
 
 
 __appname__ = 'labelme'
@@ -102,16 +109,46 @@ class WindowMixin(object):
 class MainWindow(QMainWindow, WindowMixin):
     FIT_WINDOW, FIT_WIDTH, MANUAL_ZOOM = 0, 1, 2
 
-    def __init__(self, filename=None, output=None):
+    def __init__(self, filename=None, output=None, storeData=True,
+                 prefetch=2, prefetchBudget=512 * 1024 * 1024,
+                 profiler=None):
         super(MainWindow, self).__init__()
         self.setWindowTitle(__appname__)
 
         # Whether we need to save or not.
         self.dirty = False
+        # Bumped on every change, to tell whether a background save
+        # wrote the latest state.
+        self.generation = 0
+        # Saves run one at a time, in the order they were requested.
+        self.savePool = QThreadPool()
+        self.savePool.setMaxThreadCount(1)
+        # Edits are journaled shortly after they are made, see setDirty.
+        self.journal = [None] * numCanvas
+        self.recoveredCrspdc = [[] for _ in range(numCanvas)]
+        # Whether the changes shown on each canvas were recovered, and so
+        # are not saved yet.
+        self.recovered = [False] * numCanvas
+        self.journalTimer = QTimer(self)
+        self.journalTimer.setSingleShot(True)
+        self.journalTimer.setInterval(500)
+        self.journalTimer.timeout.connect(self.writeJournal)
+        # Whether label files embed the image or only refer to it.
+        self.storeData = storeData
+        # Number of pairs after the open one loaded in the background.
+        self.prefetch = prefetch
+        self.prefetcher = Prefetcher(prefetchBudget, parent=self)
+        # Files are loaded in the background, see loadFile. A load whose
+        # token is no longer that of its canvas was canceled.
+        self.loadPool = QThreadPool(self)
+        self.loadPool.setMaxThreadCount(numCanvas)
+        self.loading = [None] * numCanvas
+        self.loadToken = [0] * numCanvas
 
         # Initalize states
         self.itemsToShapes = [[]] * numCanvas
         self.filename = [None] * numCanvas
+        self.imagePath = [None] * numCanvas
         self.imageData = [None] * numCanvas
         self.labelFile = [None] * numCanvas
         self.crspdcFile = None
@@ -122,7 +159,9 @@ class MainWindow(QMainWindow, WindowMixin):
         self.screencast = "screencast.ogv"
 
         # Main widgets and related state.
-        self.labelDialog = LabelDialog(parent=self)
+        # The dialogs are built on first use, see labelDialog.
+        self._labelDialog = None
+        self._colorDialog = None
 
         listLayout = QVBoxLayout()
         listLayout.setContentsMargins(0, 0, 0, 0)
@@ -160,7 +199,6 @@ class MainWindow(QMainWindow, WindowMixin):
         self.dock.setWidget(self.labelListContainer)
 
         self.zoomWidget = ZoomWidget()
-        self.colorDialog = ColorDialog(parent=self)
 
         self.activeCanvas = 0
         self.canvas = [None] * numCanvas
@@ -196,6 +234,9 @@ class MainWindow(QMainWindow, WindowMixin):
                           | QDockWidget.DockWidgetFloatable
         self.dock.setFeatures(self.dock.features() ^ self.dockFeatures)
 
+        if profiler is not None:
+            profiler.phase('widgets')
+
         # Actions
         action = partial(newAction, self)
         quit = action('&Quit', self.close,
@@ -209,6 +250,12 @@ class MainWindow(QMainWindow, WindowMixin):
                 enabled=False)
         close = action('&Close', self.closeFile,
                 'Ctrl+W', 'close', 'Close current file')
+        nextPair = action('&Next Pair', self.openNextPair,
+                'D', 'open', 'Open the next pair of images in the directory',
+                enabled=False)
+        prevPair = action('&Previous Pair', self.openPrevPair,
+                'A', 'open', 'Open the previous pair of images in the directory',
+                enabled=False)
         color1 = action('Polygon &Line Color', self.chooseColor1,
                 'Ctrl+L', 'color_line', 'Choose polygon line color')
         color2 = action('Polygon &Fill Color', self.chooseColor2,
@@ -300,6 +347,7 @@ class MainWindow(QMainWindow, WindowMixin):
 
         # Store actions for further handling.
         self.actions = struct(save=save, saveAs=saveAs, open=open, close=close,
+                nextPair=nextPair, prevPair=prevPair,
                 lineColor=color1, fillColor=color2,
                 create=create, delete=delete, edit=edit, copy=copy,
                 match=match, unmatch=unmatch,
@@ -309,13 +357,14 @@ class MainWindow(QMainWindow, WindowMixin):
                 zoom=zoom, zoomIn=zoomIn, zoomOut=zoomOut, zoomOrg=zoomOrg,
                 fitWindow=fitWindow, fitWidth=fitWidth,
                 zoomActions=zoomActions,
-                fileMenuActions=(open,save,saveAs,close,quit),
+                fileMenuActions=(open,nextPair,prevPair,save,saveAs,close,quit),
                 beginner=(), advanced=(),
                 editMenu=(edit, copy, delete, None, color1, color2),
                 beginnerContext=(create, edit, copy, delete, match, unmatch),
                 advancedContext=(createMode, editMode, matchMode, match, unmatch, edit, copy,
                     delete, shapeLineColor, shapeFillColor),
-                onLoadActive=(close, create, createMode, editMode, matchMode),
+                onLoadActive=(close, nextPair, prevPair,
+                    create, createMode, editMode, matchMode),
                 onShapesPresent=(saveAs, hideAll, showAll))
 
         self.menus = struct(
@@ -327,7 +376,8 @@ class MainWindow(QMainWindow, WindowMixin):
                 labelList=labelMenu)
 
         addActions(self.menus.file,
-                (open, self.menus.recentFiles, save, saveAs, close, None, quit))
+                (open, self.menus.recentFiles, nextPair, prevPair,
+                 save, saveAs, close, None, quit))
         addActions(self.menus.help, (help,))
         addActions(self.menus.view, (
             labels, advancedMode, None,
@@ -358,9 +408,19 @@ class MainWindow(QMainWindow, WindowMixin):
 
         self.statusBar().showMessage('%s started.' % __appname__)
         self.statusBar().show()
+        # Decoding gives no progress, so the bar only shows it is busy.
+        self.loadProgress = QProgressBar()
+        self.loadProgress.setRange(0, 0)
+        self.loadProgress.setMaximumWidth(120)
+        self.loadCancel = newButton('Cancel', 'cancel', self.cancelLoads)
+        for widget in (self.loadProgress, self.loadCancel):
+            widget.setVisible(False)
+            self.statusBar().addPermanentWidget(widget)
+
+        if profiler is not None:
+            profiler.phase('actions/menus')
 
         # Application state.
-        self.image = [QImage(), QImage()]
         self.filename = [None, None] #FIXME: different filenames
         self.labeling_once = output is not None
         self.output = [None, None] #FIXME: different filenames
@@ -401,6 +461,8 @@ class MainWindow(QMainWindow, WindowMixin):
         self.zoomWidget.valueChanged.connect(self.paintCanvas)
 
         self.populateModeActions()
+        if profiler is not None:
+            profiler.phase('settings')
 
         #self.firstStart = True
         #if self.firstStart:
@@ -408,6 +470,20 @@ class MainWindow(QMainWindow, WindowMixin):
 
     ## Support Functions ##
 
+    @property
+    def labelDialog(self):
+        # Built on first use, when the first shape is drawn, so that its
+        # noticeable cost is not paid at startup.
+        if self._labelDialog is None:
+            self._labelDialog = LabelDialog(parent=self)
+        return self._labelDialog
+
+    @property
+    def colorDialog(self):
+        if self._colorDialog is None:
+            self._colorDialog = ColorDialog(parent=self)
+        return self._colorDialog
+
     def noShapes(self, canvas):
         return not self.itemsToShapes[canvas]
 
@@ -450,6 +526,8 @@ class MainWindow(QMainWindow, WindowMixin):
 
     def setDirty(self):
         self.dirty = True
+        self.generation += 1
+        self.journalTimer.start()
         self.actions.save.setEnabled(True)
 
         # print("Type of imageData")
@@ -487,10 +565,16 @@ class MainWindow(QMainWindow, WindowMixin):
     def resetState(self, canvas):
         self.itemsToShapes[canvas] = []
         self.filename[canvas] = None
+        self.imagePath[canvas] = None
         # self.imageData = None
         self.imageData[canvas] = None
         # self.labelFile = None
         self.labelFile[canvas] = None
+        if self.journal[canvas]:
+            self.journal[canvas].discard()
+        self.journal[canvas] = None
+        self.recoveredCrspdc[canvas] = []
+        self.recovered[canvas] = False
         self.crspdcFile = None
         self.correspondenceNames = []
         self.correspondenceList.clear()
@@ -727,18 +811,25 @@ class MainWindow(QMainWindow, WindowMixin):
         self.canvas[canvas].loadShapes(s)
 
     def saveCrspdc(self):
+        """Snapshot the correspondences. Returns the function writing them
+        and the one to call on the GUI thread once they are written."""
         cf = CorrespondenceFile()
-        try:
-            cf.save(self.correspondenceNames, [c.shapes for c in self.canvas], self.filename)
+        cf.extractCorrespondence([c.shapes for c in self.canvas])
+        cf.crspdcByName = list(self.correspondenceNames)
+        cf.imagePath = list(self.filename)
+        def done():
             self.crspdcFile = cf
-            return True
-        except CorrespondenceFileError as e:
-            self.errorMessage('Error saving crspdc data',
-                    '<b>%s</b>' % e)
-            return False
+        return cf.write, done
 
     def saveLabels(self, canvas, filename):
-        lf = LabelFile()
+        """Snapshot the labels of a canvas. Returns the function writing
+        them to `filename' and the one to call on the GUI thread once they
+        are written."""
+        lf = (labelFileType(filename) or LabelFile)()
+        # The hash of the image data, if known, from its loading or last
+        # save.
+        imageHash = self.labelFile[canvas].imageHash\
+                if self.labelFile[canvas] else None
         def format_shape(s):
             return dict(label=str(s.label),
                         line_color=s.line_color.getRgb()\
@@ -751,16 +842,64 @@ class MainWindow(QMainWindow, WindowMixin):
 # ,
 # correspondence=s.correspondence
         shapes = [format_shape(shape) for shape in self.canvas[canvas].shapes]
-        try:
-            lf.save(filename, shapes, str(self.filename[canvas]), self.imageData[canvas],
-                self.lineColor.getRgb(), self.fillColor.getRgb())
+        journal = self.journal[canvas]
+        self.writeJournal()
+        mark = journal.mark()
+        write = partial(lf.save, filename, shapes, self.imagePath[canvas],
+                self.imageData[canvas],
+                self.lineColor.getRgb(), self.fillColor.getRgb(),
+                storeData=self.storeData,
+                imageHeight=self.canvas[canvas].imageSize().height(),
+                imageWidth=self.canvas[canvas].imageSize().width(),
+                imageHash=imageHash)
+        def done():
             self.labelFile[canvas] = lf
             self.filename[canvas] = filename
-            return True
-        except LabelFileError as e:
-            self.errorMessage('Error saving label data',
-                    '<b>%s</b>' % e)
-            return False
+            self.addRecentFile(filename)
+            # The edits up to the snapshot are in the label file now.
+            journal.compact(mark, filename + EditJournal.suffix)
+        return write, done
+
+    def writeJournal(self):
+        self.journalTimer.stop()
+        for can in range(numCanvas):
+            if self.journal[can]:
+                self.journal[can].record(self.canvas[can].shapes)
+
+    def startSave(self, jobs):
+        """Run the (write, done) pairs of saveLabels and saveCrspdc on the
+        save thread, and report back on the status bar."""
+        if not jobs:
+            return
+        def write():
+            for w, _ in jobs:
+                w()
+        worker = Worker(write)
+        worker.signals.finished.connect(
+            partial(self.saveFinished, self.generation, jobs))
+        worker.signals.failed.connect(self.saveFailed)
+        self.status('Saving...', delay=0)
+        self.savePool.start(worker)
+
+    def saveFinished(self, generation, jobs, _result=None):
+        for _, done in jobs:
+            done()
+        # Edits made while saving are not on disk yet.
+        if generation == self.generation:
+            self.recovered = [False] * numCanvas
+            self.setClean()
+        self.status('Saved')
+        if self.labeling_once:
+            self.close()
+
+    def saveFailed(self, message):
+        self.status('Error saving')
+        self.errorMessage('Error saving label data', '<b>%s</b>' % message)
+
+    def waitForSave(self):
+        """Block until the pending saves are written and reported."""
+        self.savePool.waitForDone()
+        QCoreApplication.processEvents()
 
     def copySelectedShape(self):
         canvas = self.activeCanvas
@@ -870,89 +1009,234 @@ class MainWindow(QMainWindow, WindowMixin):
             for name in self.correspondenceNames:
                 item = QListWidgetItem(name)
                 self.correspondenceList.addItem(item)
+        for can in range(numCanvas):
+            self.applyRecoveredCrspdc(can)
+            if self.journal[can]:
+                self.journal[can].sync(self.canvas[can].shapes)
+
+    def applyRecoveredCrspdc(self, canvas):
+        shapes = dict((s.id, s) for s in self.canvas[canvas].shapes)
+        for id, name, edge in self.recoveredCrspdc[canvas]:
+            if id not in shapes:
+                continue
+            if edge is None:
+                shapes[id].correspondence.pop(name, None)
+            else:
+                shapes[id].correspondence[name] = edge
+                if name not in self.correspondenceNames:
+                    self.correspondenceNames.append(name)
+                    self.correspondenceList.addItem(QListWidgetItem(name))
+        self.recoveredCrspdc[canvas] = []
 
     def loadFile(self, canvas, filename=None):
-        """Load the specified file, or the last opened file if None."""
+        """Load the specified file, or the last opened file if None.
+
+        The file is read and decoded on a thread pool, unless it was
+        prefetched, and shown once it is, see imageLoaded. Once no more
+        files are loading, the correspondences are loaded. Returns whether
+        loading started."""
         self.resetState(canvas)
         self.canvas[canvas].setEnabled(False)
+        self.loadToken[canvas] += 1
+        self.loading[canvas] = None
         if filename is None:
             filename = self.settings.get('filename', '')
         filename = str(filename)
-        if QFile.exists(filename):
-            if QFile.exists(LabelFile.getLabelFileFromName(filename)):
-                filename = LabelFile.getLabelFileFromName(filename)
-            if LabelFile.isLabelFile(filename):
-                try:
-                    self.labelFile[canvas] = LabelFile(filename)
-                    # FIXME: PyQt4 installed via Anaconda fails to load JPEG
-                    # and JSON encoded images.
-                    # https://github.com/ContinuumIO/anaconda-issues/issues/131
-                    if QImage.fromData(self.labelFile[canvas].imageData).isNull():
-                        raise LabelFileError(
-                            'Failed loading image data from label file.\n'
-                            'Maybe this is a known issue of PyQt4 built on'
-                            ' Anaconda, and may be fixed by installing PyQt5.')
-                except LabelFileError as e:
-                    self.errorMessage('Error opening file',
-                            ("<p><b>%s</b></p>"
-                             "<p>Make sure <i>%s</i> is a valid label file.")\
-                            % (e, filename))
-                    self.status("Error reading %s" % filename)
-                    return False
-                self.imageData[canvas] = self.labelFile[canvas].imageData
-                self.lineColor = QColor(*self.labelFile[canvas].lineColor)
-                self.fillColor = QColor(*self.labelFile[canvas].fillColor)
-            else:
-                # Load image:
-                # read data first and store for saving into label file.
-                self.imageData[canvas] = read(filename, None)
-                self.labelFile[canvas] = None
-            image = QImage.fromData(self.imageData[canvas])
-            if image.isNull():
-                formats = ['*.{}'.format(fmt.data().decode())
-                           for fmt in QImageReader.supportedImageFormats()]
-                self.errorMessage(
-                    'Error opening file',
-                    '<p>Make sure <i>{0}</i> is a valid image file.<br/>'
-                    'Supported image formats: {1}</p>'
-                    .format(filename, ','.join(formats)))
-                self.status("Error reading %s" % filename)
-                return False
-            self.status("Loaded %s" % os.path.basename(str(filename)))
-            self.image[canvas] = image
-            self.filename[canvas] = filename
-            self.canvas[canvas].loadPixmap(QPixmap.fromImage(image))
-            print("[DEBUG] loaded pixmap for canvas: {}".format(canvas))
-            print(self.canvas[canvas].pixmap is None)
-            if self.labelFile[canvas]:
-                self.loadLabels(canvas, self.labelFile[canvas].shapes)
-            self.setClean()
-            self.canvas[canvas].setEnabled(True)
-            self.adjustScale(initial=True)
-            self.paintCanvas()
-            self.addRecentFile(self.filename[canvas])
-            self.toggleActions(True)
+        if not QFile.exists(filename):
+            self.updateLoadProgress()
+            return False
+        token = self.loadToken[canvas]
+        self.loading[canvas] = filename
+        self.canvas[canvas].setPlaceholder(
+            'Loading %s...' % os.path.basename(filename))
+        self.updateLoadProgress()
+        loaded = self.prefetcher.take(filename)
+        if loaded is not None:
+            # Still shown later, so that files loaded together are all
+            # shown before the correspondences are loaded.
+            self.queueEvent(partial(self.imageLoaded, canvas, token, loaded))
             return True
-        return False
+        worker = Worker(self.loadCurrentFile, canvas, token, filename)
+        worker.signals.finished.connect(
+            partial(self.imageLoaded, canvas, token))
+        worker.signals.failed.connect(
+            partial(self.imageLoadFailed, canvas, token))
+        self.loadPool.start(worker)
+        return True
+
+    def loadCurrentFile(self, canvas, token, filename):
+        """Run on the load pool: load `filename', unless the load was
+        canceled while it was queued, so that stale loads do not keep the
+        pool busy."""
+        if token != self.loadToken[canvas]:
+            return None
+        return loadImageFile(filename)
+
+    def imageLoaded(self, canvas, token, loaded):
+        if token != self.loadToken[canvas]:
+            return
+        self.canvas[canvas].setPlaceholder(None)
+        # The canvas counts as loading until it is shown: showing it may
+        # ask whether to recover changes, and the other canvas may finish
+        # loading meanwhile, in the dialog's event loop.
+        self.showImageFile(canvas, loaded)
+        if token == self.loadToken[canvas]:
+            self.loading[canvas] = None
+            self.loadFinished()
+
+    def imageLoadFailed(self, canvas, token, message):
+        if token != self.loadToken[canvas]:
+            return
+        filename = self.loading[canvas]
+        self.canvas[canvas].setPlaceholder(None)
+        self.errorMessage('Error opening file', message)
+        self.status("Error reading %s" % filename)
+        if token == self.loadToken[canvas]:
+            self.loading[canvas] = None
+            self.loadFinished()
+
+    def cancelLoads(self, _value=False):
+        """Stop waiting for the files being loaded. Those still queued are
+        not loaded, and decoding cannot be interrupted, so the results of
+        the others are dropped instead."""
+        for can in range(numCanvas):
+            if self.loading[can] is not None:
+                self.loadToken[can] += 1
+                self.loading[can] = None
+                self.canvas[can].setPlaceholder(None)
+        self.status('Loading canceled')
+        self.loadFinished()
+
+    def loadFinished(self):
+        self.updateLoadProgress()
+        if not any(self.loading):
+            self.loadCrspdc()
+            self.prefetchPairs()
+
+    def updateLoadProgress(self):
+        busy = any(self.loading)
+        self.loadProgress.setVisible(busy)
+        self.loadCancel.setVisible(busy)
+
+    def showImageFile(self, canvas, loaded):
+        """Show a LoadedImage, with its labels, on a canvas."""
+        filename = loaded.filename
+        self.labelFile[canvas] = loaded.labelFile
+        self.imageData[canvas] = loaded.imageData
+        self.imagePath[canvas] = loaded.imagePath
+        if loaded.labelFile:
+            self.lineColor = QColor(*loaded.labelFile.lineColor)
+            self.fillColor = QColor(*loaded.labelFile.fillColor)
+        self.status("Loaded %s" % os.path.basename(str(filename)))
+        self.filename[canvas] = filename
+        # Kept by the canvas only, not by the window as well.
+        self.canvas[canvas].loadImage(loaded.image, loaded.levels)
+        shapes = loaded.shapes
+        labelPath = filename if self.labelFile[canvas]\
+                else LabelFile.getLabelFileFromName(filename)
+        journal = EditJournal.forLabelFile(labelPath)
+        recovered = journal.exists() and\
+                self.recoverChangesDialog(journal.filename)
+        if recovered:
+            shapes, self.recoveredCrspdc[canvas] = EditJournal.replay(
+                shapes, journal.read())
+        else:
+            journal.discard()
+        if shapes:
+            self.loadLabels(canvas, shapes)
+        journal.sync(self.canvas[canvas].shapes)
+        self.journal[canvas] = journal
+        self.recovered[canvas] = bool(recovered)
+        # Showing one canvas does not undo the changes recovered on another.
+        if any(self.recovered):
+            self.setDirty()
+        else:
+            self.setClean()
+        self.canvas[canvas].setEnabled(True)
+        self.adjustScale(initial=True)
+        self.paintCanvas()
+        self.addRecentFile(self.filename[canvas])
+        self.toggleActions(True)
+        return True
+
+    def pairFiles(self, offset):
+        """The files of the pair `offset' pairs away from the open one,
+        among the images in the directory of the left one, or None.
+
+        Pairs do not overlap: the next pair starts after the right image,
+        and is as far apart as the open one. Without a right image, or
+        one elsewhere, the open pair is taken to be the left image and
+        the one after it."""
+        if self.filename[0] is None:
+            return None
+        dirname = os.path.dirname(os.path.abspath(self.filename[0]))
+        files = imageFiles(dirname)
+        bases = [os.path.splitext(f)[0] for f in files]
+        def index(filename):
+            base = os.path.splitext(os.path.abspath(filename))[0]
+            return bases.index(base) if base in bases else None
+        left = index(self.filename[0])
+        if left is None:
+            return None
+        right = index(self.filename[1]) if self.filename[1] else None
+        if right is None or right == left:
+            right = left + 1
+        step = offset * (abs(right - left) + 1)
+        left, right = left + step, right + step
+        if not (0 <= left < len(files) and 0 <= right < len(files)):
+            return None
+        return files[left], files[right]
+
+    def openPair(self, offset):
+        pair = self.pairFiles(offset)
+        if pair is None:
+            self.status('No %s pair in this directory'
+                        % ('next' if offset > 0 else 'previous'))
+            return
+        if not self.mayContinue():
+            return
+        for can in range(numCanvas):
+            self.loadFile(can, pair[can])
+
+    def prefetchPairs(self):
+        """Load the images of the next pairs in the background, so that
+        moving on to them is instant."""
+        filenames = []
+        for offset in range(1, self.prefetch + 1):
+            pair = self.pairFiles(offset)
+            if pair is None:
+                break
+            filenames.extend(pair)
+        self.prefetcher.prefetch(filenames)
 
     def resizeEvent(self, event):
         for can in range(numCanvas):
-            if self.canvas[can] and not self.image[can].isNull()\
+            if self.canvas[can] and self.canvas[can].hasImage()\
                and self.zoomMode != self.MANUAL_ZOOM:
                 self.adjustScale()
         super(MainWindow, self).resizeEvent(event)
 
     def paintCanvas(self):
         for can in range(numCanvas):
-            # assert not self.image[can].isNull(), "cannot paint null image"
-            if self.image[can].isNull():
+            if not self.canvas[can].hasImage():
                 print("canvas {}:cannot paint null image".format(can))
                 continue
             self.canvas[can].scale = 0.01 * self.zoomWidget.value()
             self.canvas[can].adjustSize()
             self.canvas[can].update()
 
+    def fitSize(self):
+        """Size of the image the zoom fits: that of the first canvas with
+        an image, as they load in any order, or None if none has one."""
+        for can in range(numCanvas):
+            size = self.canvas[can].imageSize()
+            if not size.isEmpty():
+                return size
+        return None
+
     def adjustScale(self, initial=False):
+        if self.fitSize() is None:
+            return
         value = self.scalers[self.FIT_WINDOW if initial else self.zoomMode]()
         self.zoomWidget.setValue(int(100 * value))
 
@@ -963,20 +1247,29 @@ class MainWindow(QMainWindow, WindowMixin):
         h1 = self.centralWidget().height() - e
         a1 = w1/ h1
         # Calculate a new scale value based on the pixmap's aspect ratio.
-        w2 = self.canvas[0].pixmap.width() - 0.0
-        h2 = self.canvas[0].pixmap.height() - 0.0
+        size = self.fitSize()
+        w2 = size.width() - 0.0
+        h2 = size.height() - 0.0
         a2 = w2 / h2
         return w1 / w2 if a2 >= a1 else h1 / h2
 
     def scaleFitWidth(self):
         # The epsilon does not seem to work too well here.
         w = self.centralWidget().width() - 2.0
-        return w / self.canvas[0].pixmap.width()
+        return w / self.fitSize().width()
 
     # FIXME:adapt for two filenames
     def closeEvent(self, event):
         if not self.mayContinue():
             event.ignore()
+        else:
+            for journal in self.journal:
+                if journal:
+                    journal.discard()
+            self.prefetcher.clear()
+            self.prefetcher.waitForDone()
+            self.loadToken = [token + 1 for token in self.loadToken]
+            self.loadPool.waitForDone()
         s = self.settings
         # s['filename'] = self.filename if self.filename[0] else ''
         s['filename'] = self.filename
@@ -992,9 +1285,15 @@ class MainWindow(QMainWindow, WindowMixin):
 
     ## User Dialogs ##
 
+    def openNextPair(self, _value=False):
+        self.openPair(1)
+
+    def openPrevPair(self, _value=False):
+        self.openPair(-1)
+
     def loadRecent(self, canvas, filename):
         if self.mayContinue():
-            self.loadFile(filename, canvas)
+            self.loadFile(canvas, filename)
 
     def openFile(self, _value=False):
         if not self.mayContinue():
@@ -1005,7 +1304,8 @@ class MainWindow(QMainWindow, WindowMixin):
             formats = ['*.{}'.format(fmt.data().decode())
                        for fmt in QImageReader.supportedImageFormats()]
             filters = "Image & Label files (%s)" % \
-                    ' '.join(formats + ['*%s' % LabelFile.suffix])
+                    ' '.join(formats + ['*%s' % LabelFile.suffix,
+                                        '*%s' % BinaryLabelFile.suffix])
             filename = QFileDialog.getOpenFileName(self,
                 '%s - Choose Image or Label file' % __appname__, path, filters)
             if PYQT5:
@@ -1013,11 +1313,11 @@ class MainWindow(QMainWindow, WindowMixin):
             filename = str(filename)
             if filename:
                 self.loadFile(can, filename)
-        self.loadCrspdc()
 
     def saveFile(self, _value=False):
+        jobs = []
         for can in range(numCanvas):
-            assert not self.image[can].isNull(), "cannot save empty image"
+            assert self.canvas[can].hasImage(), "cannot save empty image"
             if self.hasLabels(can):
                 # if self.labelFile[can]:
                 #     self._saveFile(can, self.filename[can])
@@ -1025,19 +1325,29 @@ class MainWindow(QMainWindow, WindowMixin):
                 #     self._saveFile(can, self.output[can])
                 # else:
                 #     self._saveFile(can, self.saveFileDialog(can))
-                self._saveFile(can, LabelFile.getLabelFileFromName(self.filename[can]))
-        self.saveCrspdc()
+                # Keep the format the labels were loaded from.
+                cls = type(self.labelFile[can]) if self.labelFile[can]\
+                        else LabelFile
+                jobs.append(self.saveLabels(
+                    can, cls.getLabelFileFromName(self.filename[can])))
+        jobs.append(self.saveCrspdc())
+        self.startSave(jobs)
 
 
     def saveFileAs(self, _value=False):
+        jobs = []
         for can in range(numCanvas):
-            assert not self.image[can].isNull(), "cannot save empty image"
+            assert self.canvas[can].hasImage(), "cannot save empty image"
             if self.hasLabels(can):
-                self._saveFile(can, self.saveFileDialog(can))
+                filename = self.saveFileDialog(can)
+                if filename:
+                    jobs.append(self.saveLabels(can, filename))
+        self.startSave(jobs)
 
     def saveFileDialog(self, canvas):
         caption = '%s - Choose File' % __appname__
-        filters = 'Label files (*%s)' % LabelFile.suffix
+        filters = 'Label files (*%s *%s)' % (LabelFile.suffix,
+                                             BinaryLabelFile.suffix)
         dlg = QFileDialog(self, caption, self.currentPath(canvas), filters)
         dlg.setDefaultSuffix(LabelFile.suffix[1:])
         dlg.setAcceptMode(QFileDialog.AcceptSave)
@@ -1047,20 +1357,12 @@ class MainWindow(QMainWindow, WindowMixin):
         default_labelfile_name = os.path.join(self.currentPath(canvas),
                                               basename + LabelFile.suffix)
         filename = dlg.getSaveFileName(
-            self, 'Choose File', default_labelfile_name,
-            'Label files (*%s)' % LabelFile.suffix)
+            self, 'Choose File', default_labelfile_name, filters)
         if PYQT5:
             filename, _ = filename
         filename = str(filename)
         return filename
 
-    def _saveFile(self, canvas, filename):
-        if filename and self.saveLabels(canvas, filename):
-            self.addRecentFile(filename)
-            self.setClean()
-            if self.labeling_once:
-                self.close()
-
     def closeFile(self, _value=False):
         if not self.mayContinue():
             return
@@ -1070,6 +1372,8 @@ class MainWindow(QMainWindow, WindowMixin):
             self.resetState(can)
             self.canvas[can].setEnabled(False)
         self.actions.saveAs.setEnabled(False)
+        if any(self.loading):
+            self.cancelLoads()
 
     # Message Dialogs. #
     def hasLabels(self, canvas):
@@ -1080,8 +1384,14 @@ class MainWindow(QMainWindow, WindowMixin):
         return True
 
     def mayContinue(self):
+        self.waitForSave()
         return not (self.dirty and not self.discardChangesDialog())
 
+    def recoverChangesDialog(self, filename):
+        yes, no = QMessageBox.Yes, QMessageBox.No
+        msg = 'Unsaved changes were found in %s, recover them?' % filename
+        return yes == QMessageBox.warning(self, 'Attention', msg, yes|no)
+
     def discardChangesDialog(self):
         yes, no = QMessageBox.Yes, QMessageBox.No
         msg = 'You have unsaved changes, proceed anyway?'
@@ -1187,16 +1497,44 @@ class Settings(object):
         return value
 
 
-def inverted(color):
-    return QColor(*[255 - v for v in color.getRgb()])
+class StartupProfiler(QObject):
+    """Time the phases of startup, up to the first painted frame of a
+    widget, and print them to stderr."""
+
+    def __init__(self, start):
+        super(StartupProfiler, self).__init__()
+        self.start = self.last = start
+        self.phases = []
+        self.widget = None
+
+    def phase(self, name):
+        """End the current phase, called `name'."""
+        now = time.time()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def watch(self, widget):
+        self.widget = widget
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if obj is self.widget and event.type() == QEvent.Paint:
+            self.widget.removeEventFilter(self)
+            # Report once the paint event, and those of the children, are
+            # processed.
+            QTimer.singleShot(0, self.report)
+        return False
 
+    def report(self):
+        self.phase('first paint')
+        for name, elapsed in self.phases:
+            sys.stderr.write('%-16s %8.1f ms\n' % (name, elapsed * 1000))
+        sys.stderr.write('%-16s %8.1f ms\n'
+                         % ('total', (self.last - self.start) * 1000))
 
-def read(filename, default=None):
-    try:
-        with open(filename, 'rb') as f:
-            return f.read()
-    except:
-        return default
+
+def inverted(color):
+    return QColor(*[255 - v for v in color.getRgb()])
 
 
 def main():
@@ -1204,15 +1542,45 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('filename', nargs='?', help='image or label filename')
     parser.add_argument('-O', '--output', help='output label name')
+    parser.add_argument('--nodata', dest='storeData', action='store_false',
+                        help='refer to the image from label files instead '
+                             'of embedding it')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of pairs after the open one to load '
+                             'in the background (default: %(default)s)')
+    parser.add_argument('--prefetch-budget', type=int, default=512,
+                        help='memory for images loaded in the background, '
+                             'in MB (default: %(default)s)')
+    parser.add_argument('--image-cache', type=int, default=256,
+                        help='memory for recently opened images, in MB '
+                             '(default: %(default)s)')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print the time spent in each phase of startup, '
+                             'up to the first painted frame')
     args = parser.parse_args()
 
+    profiler = None
+    if args.profile_startup:
+        profiler = StartupProfiler(startTime)
+        profiler.phase('imports')
+
     filename = args.filename
     output = args.output
+    imageCache.budget = args.image_cache * 1024 * 1024
 
     app = QApplication(sys.argv)
     app.setApplicationName(__appname__)
     app.setWindowIcon(newIcon("app"))
-    win = MainWindow(filename, output)
+    if profiler is not None:
+        profiler.phase('application')
+    win = MainWindow(filename, output, storeData=args.storeData,
+                     prefetch=args.prefetch,
+                     prefetchBudget=args.prefetch_budget * 1024 * 1024,
+                     profiler=profiler)
+    if profiler is not None:
+        profiler.watch(win)
     win.show()
     win.raise_()
+    if profiler is not None:
+        profiler.phase('show')
     sys.exit(app.exec_())
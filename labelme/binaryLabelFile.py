@@ -0,0 +1,222 @@
+#
+# Copyright (C) 2011 Michael Pitidis, Hussein Abdulwahid.
+#
+# This file is part of Labelme.
+#
+# Labelme is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Labelme is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Labelme.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from base64 import b64encode, b64decode
+from functools import partial
+import json
+import os.path
+import struct
+
+import numpy as np
+
+from labelme.labelFile import LabelFile, LabelFileError, PY2, atomicOpen
+
+
+MAGIC = b'LBLMBIN\0'
+# Version 1 had float32 points, which rounded non-integer coordinates.
+VERSION = 2
+
+# magic, version, length of the JSON header
+_prefix = struct.Struct('<8sII')
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+class BinaryLabelFile(LabelFile):
+    """Label file with the shape points stored as float64 arrays.
+
+    The layout, little-endian and with every block aligned to 8 bytes, is:
+    the magic and version, a JSON header with the image path, colors and
+    the label, colors and id of every shape, the uint32 offsets of the
+    shapes into the points (one more than there are shapes), the float64
+    (x, y) points and finally the raw image data, if embedded.
+
+    `offsets' and `points' are read into arrays on load, for bulk access
+    to the geometry. The file is not kept open, so that it can be
+    replaced when saving, also on Windows.
+    """
+    suffix = '.lbl'
+
+    def __init__(self, filename=None, lazy=False):
+        self.header = None
+        self.offsets = np.zeros(1, dtype='<u4')
+        self.points = np.zeros((0, 2), dtype='<f8')
+        super(BinaryLabelFile, self).__init__(filename, lazy=lazy)
+
+    def load(self, filename, lazy=False):
+        try:
+            with open(filename, 'rb') as f:
+                magic, version, size = _prefix.unpack(f.read(_prefix.size))
+                if magic != MAGIC:
+                    raise LabelFileError('%s is not a binary label file'
+                                         % filename)
+                if version > VERSION:
+                    raise LabelFileError('%s has unsupported version %d'
+                                         % (filename, version))
+                header = json.loads(f.read(size).decode('utf-8'))
+                f.seek(_align(_prefix.size + size))
+                offsets = np.fromfile(f, dtype='<u4',
+                                      count=len(header['shapes']) + 1)
+                f.seek(_align(f.tell()))
+                points = np.fromfile(f, dtype='<f4' if version < 2 else '<f8',
+                                     count=2 * int(offsets[-1]))
+                points = points.astype('<f8', copy=False).reshape(-1, 2)
+                pos = _align(f.tell())
+            imagePath = header['imagePath']
+            imageFile = imageHash = None
+            if header.get('imageDataLength') is not None:
+                imageSource = partial(self.readBlock, filename, pos,
+                                      header['imageDataLength'])
+            else:
+                imageFile = self.resolveImagePath(filename, imagePath)
+                imageHash = header.get('imageHash')
+                imageSource = partial(self.readImageFile, imageFile,
+                                      imageHash)
+            imageData = None if lazy else imageSource()
+            # Only replace data after everything is loaded.
+            self.header = header
+            self.offsets = offsets
+            self.points = points
+            self.imagePath = imagePath
+            self.imageFile = imageFile
+            self.imageHash = imageHash
+            self.imageData = imageData
+            if lazy:
+                self._imageSource = imageSource
+            self.lineColor = header['lineColor']
+            self.fillColor = header['fillColor']
+            self.shapes = self.iterShapes()
+        except LabelFileError:
+            raise
+        except Exception as e:
+            raise LabelFileError(e)
+
+    @staticmethod
+    def readBlock(filename, offset, length):
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def iterShapes(self):
+        """Yield (label, points, line color, fill color, id) like the
+        shapes of a LabelFile."""
+        for i, s in enumerate(self.header['shapes']):
+            points = self.points[self.offsets[i]:self.offsets[i+1]]
+            yield (s['label'], points.tolist(), s['line_color'],
+                   s['fill_color'], s['shape_id'])
+
+    def save(self, filename, shapes, imagePath, imageData,
+            lineColor=None, fillColor=None, storeData=True,
+            imageHeight=None, imageWidth=None, imageHash=None):
+        data = self.document(filename, shapes, imagePath, imageData,
+                             lineColor, fillColor, storeData,
+                             imageHeight, imageWidth, imageHash)
+        try:
+            self.write(filename, data)
+        except Exception as e:
+            raise LabelFileError(e)
+        self.imageHash = data.get('imageHash')
+
+    @staticmethod
+    def write(filename, data):
+        """Write a label file document, as returned by document(), in the
+        binary format."""
+        header = dict((k, v) for k, v in data.items()
+                      if k not in ('shapes', 'imageData'))
+        header['shapes'] = [
+            dict((k, v) for k, v in s.items() if k != 'points')
+            for s in data['shapes']]
+        imageData = data['imageData']
+        header['imageDataLength'] = None if imageData is None\
+                else len(imageData)
+        points = [np.asarray(s['points'], dtype='<f8').reshape(-1, 2)
+                  for s in data['shapes']]
+        offsets = np.zeros(len(points) + 1, dtype='<u4')
+        offsets[1:] = np.cumsum([len(p) for p in points])
+        points = np.concatenate(points) if points\
+                else np.zeros((0, 2), dtype='<f8')
+        header = json.dumps(header).encode('utf-8')
+        with atomicOpen(filename, 'wb') as f:
+            for block in [_prefix.pack(MAGIC, VERSION, len(header)) + header,
+                          offsets.tobytes(), points.tobytes()]:
+                f.write(block)
+                f.write(b'\0' * (_align(len(block)) - len(block)))
+            if imageData is not None:
+                f.write(imageData)
+
+    def toDict(self):
+        """The equivalent JSON label file document."""
+        data = dict((k, v) for k, v in self.header.items()
+                    if k != 'imageDataLength')
+        data['shapes'] = [
+            dict(label=label, points=points, line_color=line_color,
+                 fill_color=fill_color, shape_id=shape_id)
+            for label, points, line_color, fill_color, shape_id
+            in self.iterShapes()]
+        data['imageData'] = None
+        if self.header.get('imageDataLength') is not None:
+            data['imageData'] = b64encode(self.imageData).decode('utf-8')
+        return data
+
+
+def _rebaseImagePath(data, srcFile, dstFile):
+    """Make a relative image path of label file `srcFile' relative to
+    `dstFile' instead."""
+    imagePath = data.get('imagePath')
+    if not imagePath or os.path.isabs(imagePath):
+        return
+    imagePath = LabelFile.resolveImagePath(srcFile, imagePath)
+    try:
+        data['imagePath'] = os.path.relpath(
+            imagePath, os.path.dirname(os.path.abspath(dstFile)))
+    except ValueError:
+        # On another drive.
+        data['imagePath'] = imagePath
+
+
+def jsonToBinary(jsonFile, binaryFile=None):
+    """Convert a JSON label file to a binary one next to it."""
+    if binaryFile is None:
+        binaryFile = BinaryLabelFile.getLabelFileFromName(jsonFile)
+    with open(jsonFile, 'rb') as f:
+        data = json.loads(f.read().decode('utf-8'))
+    _rebaseImagePath(data, jsonFile, binaryFile)
+    if data.get('imageData') is not None:
+        data['imageData'] = b64decode(data['imageData'])
+    try:
+        BinaryLabelFile.write(binaryFile, data)
+    except Exception as e:
+        raise LabelFileError(e)
+    return binaryFile
+
+
+def binaryToJson(binaryFile, jsonFile=None):
+    """Convert a binary label file to a JSON one next to it."""
+    if jsonFile is None:
+        jsonFile = LabelFile.getLabelFileFromName(binaryFile)
+    data = BinaryLabelFile(binaryFile, lazy=True).toDict()
+    _rebaseImagePath(data, binaryFile, jsonFile)
+    try:
+        with atomicOpen(jsonFile, 'wb' if PY2 else 'w') as f:
+            json.dump(data, f, ensure_ascii=True, indent=2)
+    except Exception as e:
+        raise LabelFileError(e)
+    return jsonFile
@@ -16,10 +16,6 @@
 # You should have received a copy of the GNU General Public License
 # along with Labelme.  If not, see <http://www.gnu.org/licenses/>.
 #
-from math import pi
-import numpy as np
-
-
 try:
     from PyQt5.QtGui import *
     from PyQt5.QtCore import *
@@ -31,6 +27,9 @@ except ImportError:
     PYQT5 = False
 
 from labelme.shape import Shape
+from labelme.shapeIndex import ShapeIndex
+from labelme.edgeGraph import EdgeGraph
+from labelme.tiledImage import TiledImage
 from labelme.lib import distance
 
 # TODO:
@@ -56,6 +55,8 @@ class Canvas(QWidget):
 
     epsilon = 11.0
     lineEps = 2.0
+    # Images with more pixels than this are drawn from a tile pyramid.
+    tileThreshold = TiledImage.threshold
 
     def __init__(self, id, *args, **kwargs):
         super(Canvas, self).__init__(*args, **kwargs)
@@ -64,6 +65,11 @@ class Canvas(QWidget):
         assert(self.id >= 0)
         self.mode = self.EDIT
         self.shapes = []
+        self.shapeIndex = ShapeIndex()
+        # Junctions and edges for line matching, only kept up to date
+        # while matching, see updateEdgeGraph().
+        self.edgeGraph = EdgeGraph()
+        self._edgeGraphDirty = True
         self.current = None
         self.selectedShape=None # save the selected shape here
         self.selectedShapeCopy=None
@@ -74,6 +80,9 @@ class Canvas(QWidget):
         self.offsets = QPointF(), QPointF()
         self.scale = 1.0
         self.pixmap = QPixmap()
+        self.tiles = None
+        # Text shown instead of the image while there is none.
+        self.placeholder = None
         self.visible = {}
         self._hideBackround = False
         self.hideBackround = False
@@ -81,13 +90,18 @@ class Canvas(QWidget):
         self.hVertex = None
         self.hEdge = None
         self._painter = QPainter()
+        # Pre-rendered image and shapes left untouched by the ongoing
+        # interaction, see beginInteraction().
+        self._activeShapes = None
+        self._layer = None
+        self._layerKey = None
         self._cursor = CURSOR_DEFAULT
         # Menus:
         self.menus = (QMenu(), QMenu())
         # Set widget options.
         self.setMouseTracking(True)
         self.setFocusPolicy(Qt.WheelFocus)
-        self.vertexUpdated.connect(self.updateCanvasLinesAndPoints)
+        self.vertexUpdated.connect(self.setEdgeGraphDirty)
 
     def enterEvent(self, ev):
         self.overrideCursor(self._cursor)
@@ -117,6 +131,7 @@ class Canvas(QWidget):
 
     def setEditing(self, mode):
         self.mode = mode
+        self.endInteraction()
         # if mode is self.CREATE or mode is self.MATCH: # Create
         self.unHighlight()
         self.deSelectShape()
@@ -129,17 +144,19 @@ class Canvas(QWidget):
     def selectedVertex(self):
         return self.hVertex is not None
 
+    def shapesAt(self, point, margin=0.0):
+        """Visible shapes whose bounding box, grown by `margin', contains
+        the point, top-most first."""
+        return [s for s in self.shapeIndex.queryPoint(point, margin)
+                if self.isVisible(s)]
+
     def findEdgeByPoints(self, p1, p2):
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
-            try:
-                id1 = shape.points.index(p1)
-                if shape.points[id1+1] == p2:
-                    return (shape, id1)
-                if shape.points[id1-1] == p2:
-                    return (shape, id1-1)
-            except:
-                continue
-        return (None, None)
+        owners = [(shape, idLine) for shape, idLine
+                  in self.edgeGraph.owners(p1, p2) if self.isVisible(shape)]
+        if not owners:
+            return (None, None)
+        # The top-most shape wins, as for any other hit-test.
+        return max(owners, key=lambda o: self.shapeIndex.zOrder(o[0]))
 
     def findEdgeByText(self, text):
         for shape in reversed([s for s in self.shapes]):
@@ -162,6 +179,8 @@ class Canvas(QWidget):
             self.overrideCursor(CURSOR_DRAW)
             if self.current:
                 color = self.lineColor
+                self.updateShapes(self.current, self.line)
+                self.current.highlightClear()
                 if self.outOfPixmap(pos):
                     # Don't allow the user to draw outside the pixmap.
                     # Project the point to the pixmap's edges.
@@ -196,8 +215,7 @@ class Canvas(QWidget):
                     #             self.overrideCursor(CURSOR_ONLINE)
                 self.line[1] = pos
                 self.line.line_color = color
-                self.repaint()
-                self.current.highlightClear()
+                self.updateShapes(self.line)
             return
 
         # Polygon copy moving.
@@ -205,10 +223,9 @@ class Canvas(QWidget):
             if self.selectedShapeCopy and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
                 self.boundedMoveShape(self.selectedShapeCopy, pos)
-                self.repaint()
             elif self.selectedShape:
                 self.selectedShapeCopy = self.selectedShape.copy()
-                self.repaint()
+                self.updateShapes(self.selectedShapeCopy)
             return
 
         # Polygon/Vertex moving.
@@ -218,6 +235,8 @@ class Canvas(QWidget):
                     # self.boundedMoveVertex(pos)
                     # self.shapeMoved.emit()
                     # self.repaint()
+                    self.updateShapes(self.hShape)
+                    self.hShape.highlightClear()
                     idx_local = None
                     if len(self.hShape.points) > 0:
                         idx_local = self.closeEnoughPoints(pos, points=self.hShape.points, index=self.hVertex)
@@ -228,18 +247,17 @@ class Canvas(QWidget):
                         self.overrideCursor(CURSOR_POINT)
                         self.hShape.highlightVertex(idx_local, Shape.NEAR_VERTEX)
 
-                    self.hShape.points[self.hVertex] = pos
+                    self.hShape[self.hVertex] = pos
+                    self.shapeIndex.update(self.hShape)
+                    self.updateShapes(self.hShape)
                     self.shapeMoved.emit()
                     self.vertexUpdated.emit()
-                    self.repaint()
-                    self.hShape.highlightClear()
 
                 elif self.selectedShape and self.prevPoint:
                     self.overrideCursor(CURSOR_MOVE)
                     self.boundedMoveShape(self.selectedShape, pos)
                     self.shapeMoved.emit()
                     self.vertexUpdated.emit()
-                    self.repaint()
                 return
 
 
@@ -248,56 +266,56 @@ class Canvas(QWidget):
             # - Highlight vertex
             # Update shape/vertex fill and tooltip value accordingly.
             self.setToolTip("Image")
-            for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+            for shape in self.shapesAt(pos, self.epsilon):
                 # Look for a nearby vertex to highlight. If that fails,
                 # check if we happen to be inside a shape.
                 index = shape.nearestVertex(pos, self.epsilon)
                 if index is not None:
                     if self.selectedVertex():
                         self.hShape.highlightClear()
+                        self.updateShapes(self.hShape)
                     self.hVertex, self.hShape = index, shape
                     shape.highlightVertex(index, shape.MOVE_VERTEX)
                     self.overrideCursor(CURSOR_POINT)
                     self.setToolTip("Click & drag to move point")
                     self.setStatusTip(self.toolTip())
-                    self.update()
+                    self.updateShapes(shape)
                     break
                 elif shape.containsPoint(pos):
                     if self.selectedVertex():
                         self.hShape.highlightClear()
+                        self.updateShapes(self.hShape)
                     self.hVertex, self.hShape = None, shape
                     self.setToolTip("Click & drag to move shape '%s'" % shape.label)
                     self.setStatusTip(self.toolTip())
                     self.overrideCursor(CURSOR_GRAB)
-                    self.update()
+                    self.updateShapes(shape)
                     break
             else: # Nothing found, clear highlights, reset state.
                 if self.hShape:
                     self.hShape.highlightClear()
-                    self.update()
+                    self.updateShapes(self.hShape)
                 self.hVertex, self.hShape = None, None
             return
 
         if self.matching():
             self.setToolTip("Image")
-            index = self.pointOnLine(pos)
-            if index is not None:
-                # print(self.points[index[0]])
-                # print(self.points[index[1]])
-                (shape, idLine) = self.findEdgeByPoints(self.points[index[0]], self.points[index[1]])
+            line = self.pointOnLine(pos)
+            if line is not None:
+                (shape, idLine) = self.findEdgeByPoints(*line)
                 self.hShape, self.hEdge = shape, idLine
                 if shape is not None:
                     shape.highlightEdge(idLine)
                     self.setToolTip("Click to select the line")
                     self.setStatusTip(self.toolTip())
                     self.overrideCursor(CURSOR_GRAB)
-                    self.update()
+                    self.updateShapes(shape)
                 else:
                     print('wtf, there is not corresponding edge, check here plz')
             else:
                 if self.hShape:
                     self.hShape.highlightClear()
-                    self.update()
+                    self.updateShapes(self.hShape)
                 self.hEdge, self.hShape = None, None
             return
 
@@ -325,27 +343,33 @@ class Canvas(QWidget):
                     self.line.points = [pos, pos]
                     self.setHiding()
                     self.drawingPolygon.emit(self.id, True)
-                    self.update()
+                    self.updateShapes(self.current, self.line)
+                    self.beginInteraction()
             elif self.editing():
                 self.selectShapePoint(pos)
                 self.prevPoint = pos
-                self.repaint()
+                if self.selectedVertex():
+                    self.beginInteraction(self.hShape)
+                elif self.selectedShape:
+                    self.beginInteraction(self.selectedShape)
             elif self.matching():
                 self.selectShapeEdgeByPoint(pos)
         elif ev.button() == Qt.RightButton and self.editing():
             self.selectShapePoint(pos)
             self.prevPoint = pos
-            self.repaint()
+            self.beginInteraction()
 
     def mouseReleaseEvent(self, ev):
+        if not self.drawing():
+            self.endInteraction()
         if ev.button() == Qt.RightButton:
             menu = self.menus[bool(self.selectedShapeCopy)]
             self.restoreCursor()
             if not menu.exec_(self.mapToGlobal(ev.pos()))\
                and self.selectedShapeCopy:
                 # Cancel the move by deleting the shadow copy.
+                self.updateShapes(self.selectedShapeCopy)
                 self.selectedShapeCopy = None
-                self.repaint()
         elif ev.button() == Qt.LeftButton and self.selectedShape:
             self.overrideCursor(CURSOR_GRAB)
 
@@ -356,14 +380,17 @@ class Canvas(QWidget):
         #del shape.line_color
         if copy:
             self.shapes.append(shape)
+            self.shapeIndex.insert(shape)
             self.selectedShape.selected = False
+            self.updateShapes(self.selectedShape, shape)
             self.selectedShape = shape
-            self.repaint()
         else:
             shape.label = self.selectedShape.label
             self.deleteSelected()
             self.shapes.append(shape)
+            self.shapeIndex.insert(shape)
         self.selectedShapeCopy = None
+        self.setEdgeGraphDirty()
 
     def hideBackroundShapes(self, value):
         self.hideBackround = value
@@ -371,10 +398,14 @@ class Canvas(QWidget):
             # Only hide other shapes if there is a current selection.
             # Otherwise the user will not be able to select a shape.
             self.setHiding(True)
-            self.repaint()
 
     def setHiding(self, enable=True):
-        self._hideBackround = self.hideBackround if enable else False
+        hide = self.hideBackround if enable else False
+        if hide != self._hideBackround:
+            # Shapes all over the canvas appear or disappear.
+            self.invalidateLayer()
+            self.update()
+        self._hideBackround = hide
 
     def canCloseShape(self):
         return self.drawing() and self.current and len(self.current) >= 2
@@ -393,7 +424,7 @@ class Canvas(QWidget):
         self.selectedShape = shape
         self.setHiding()
         self.selectionChanged.emit(self.id, True)
-        self.update()
+        self.updateShapes(shape)
 
     def selectShapePoint(self, point):
         """Select the first shape created which contains this point."""
@@ -401,11 +432,13 @@ class Canvas(QWidget):
         if self.selectedVertex(): # A vertex is marked for selection.
             index, shape = self.hVertex, self.hShape
             shape.highlightVertex(index, shape.MOVE_VERTEX)
+            self.updateShapes(shape)
             return
-        for shape in reversed(self.shapes):
-            if self.isVisible(shape) and shape.containsPoint(point):
+        for shape in self.shapesAt(point):
+            if shape.containsPoint(point):
                 shape.selected = True
                 self.selectedShape = shape
+                self.updateShapes(shape)
                 self.calculateOffsets(shape, point)
                 self.setHiding()
                 self.selectionChanged.emit(self.id, True)
@@ -416,15 +449,13 @@ class Canvas(QWidget):
         self.selectedShape = shape
         self.selectedEdge = idLine
         self.selectionChanged.emit(self.id, True)
-        self.update()
+        self.updateShapes(shape)
 
     def selectShapeEdgeByPoint(self, point):
         self.deSelectShape()
-        index = self.pointOnLine(point)
-        if index is not None:
-            # print(self.points[index[0]])
-            # print(self.points[index[1]])
-            (shape, idLine) = self.findEdgeByPoints(self.points[index[0]], self.points[index[1]])
+        line = self.pointOnLine(point)
+        if line is not None:
+            (shape, idLine) = self.findEdgeByPoints(*line)
             self.hShape, self.hEdge = shape, idLine
             if shape is not None:
                 self.selectShapeEdge(shape, idLine)
@@ -453,8 +484,9 @@ class Canvas(QWidget):
             pos -= QPointF(min(0, o1.x()), min(0, o1.y()))
         o2 = pos + self.offsets[1]
         if self.outOfPixmap(o2):
-            pos += QPointF(min(0, self.pixmap.width() - o2.x()),
-                           min(0, self.pixmap.height()- o2.y()))
+            size = self.imageSize()
+            pos += QPointF(min(0, size.width() - o2.x()),
+                           min(0, size.height()- o2.y()))
         # The next line tracks the new position of the cursor
         # relative to the shape, but also results in making it
         # a bit "shaky" when nearing the border and allows it to
@@ -462,7 +494,10 @@ class Canvas(QWidget):
         #self.calculateOffsets(self.selectedShape, pos)
         dp = pos - self.prevPoint
         if dp:
+            self.updateShapes(shape)
             shape.moveBy(dp)
+            self.shapeIndex.update(shape)
+            self.updateShapes(shape)
             self.prevPoint = pos
             return True
         return False
@@ -472,18 +507,19 @@ class Canvas(QWidget):
             self.selectedShape.selected = False
             self.selectedShape._selectedEdgeIndex = None
             self.selectedShape._highlightEdgeIndex = None
+            self.updateShapes(self.selectedShape)
             self.selectedShape = None
             self.selectedEdge = None
             self.setHiding(False)
             self.selectionChanged.emit(self.id, False)
-            self.update()
 
     def deleteSelected(self):
         if self.selectedShape:
             shape = self.selectedShape
             self.shapes.remove(self.selectedShape)
+            self.shapeIndex.remove(self.selectedShape)
+            self.updateShapes(self.selectedShape)
             self.selectedShape = None
-            self.update()
             self.vertexUpdated.emit()
             return shape
 
@@ -492,9 +528,11 @@ class Canvas(QWidget):
             shape = self.selectedShape.copy()
             self.deSelectShape()
             self.shapes.append(shape)
+            self.shapeIndex.insert(shape)
             shape.selected = True
             self.selectedShape = shape
             self.boundedShiftShape(shape)
+            self.setEdgeGraphDirty()
             return shape
 
     def boundedShiftShape(self, shape):
@@ -508,7 +546,13 @@ class Canvas(QWidget):
             self.boundedMoveShape(shape, point + offset)
 
     def paintEvent(self, event):
-        if not self.pixmap:
+        if not self.hasImage():
+            if self.placeholder:
+                p = self._painter
+                p.begin(self)
+                p.drawText(self.rect(), Qt.AlignCenter, self.placeholder)
+                p.end()
+                return
             return super(Canvas, self).paintEvent(event)
 
         p = self._painter
@@ -520,12 +564,22 @@ class Canvas(QWidget):
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
 
-        p.drawPixmap(0, 0, self.pixmap)
+        exposed = QRectF(event.rect())
+        exposed = QRectF(self.transformPos(exposed.topLeft()),
+                         self.transformPos(exposed.bottomRight()))
         Shape.scale = self.scale
-        for shape in self.shapes:
-            if (shape.selected or not self._hideBackround) and self.isVisible(shape):
-                # shape.fill = shape.selected or shape == self.hShape
-                shape.paint(p)
+        layer = self.staticLayer()
+        if layer is not None:
+            # Everything but the shapes being edited is pre-rendered.
+            p.save()
+            p.resetTransform()
+            p.drawPixmap(self._layerKey[0].topLeft(), layer)
+            p.restore()
+            for shape in self._activeShapes:
+                if self.isShapePainted(shape):
+                    shape.paint(p)
+        else:
+            self.paintStatic(p, exposed)
         if self.current:
             self.current.paint(p)
             self.line.paint(p)
@@ -534,6 +588,92 @@ class Canvas(QWidget):
 
         p.end()
 
+    def paintStatic(self, p, exposed, skip=()):
+        """Paint the image and the shapes reaching into `exposed', in image
+        coordinates, except those in `skip'."""
+        if self.tiles is not None:
+            self.tiles.draw(p, exposed, self.scale)
+        else:
+            p.drawPixmap(0, 0, self.pixmap)
+        m = self.widgetRect(QRectF()).width() / 2.0 / self.scale
+        exposed = exposed.adjusted(-m, -m, m, m)
+        for shape in reversed(self.shapeIndex.query(
+                exposed.left(), exposed.top(),
+                exposed.right(), exposed.bottom())):
+            if shape not in skip and self.isShapePainted(shape):
+                # shape.fill = shape.selected or shape == self.hShape
+                shape.paint(p)
+
+    def isShapePainted(self, shape):
+        return (shape.selected or not self._hideBackround) and self.isVisible(shape)
+
+    def beginInteraction(self, *shapes):
+        """Start a drag or a drawing in which only `shapes', and the shapes
+        not part of the canvas yet, change. The rest is painted once into
+        an offscreen layer and reused until endInteraction()."""
+        self._activeShapes = shapes
+        self.invalidateLayer()
+
+    def endInteraction(self):
+        self._activeShapes = None
+        self.invalidateLayer()
+
+    def invalidateLayer(self):
+        self._layer = None
+        self._layerKey = None
+
+    def staticLayer(self):
+        if self._activeShapes is None:
+            return None
+        visible = self.visibleRegion().boundingRect()
+        if visible.isEmpty():
+            return None
+        # Sized in device pixels, so that it is sharp on high DPI screens.
+        ratio = self.devicePixelRatioF() \
+                if hasattr(self, 'devicePixelRatioF') else 1.0
+        key = (visible, self.scale, self._hideBackround,
+               Shape.line_color.rgba(), Shape.fill_color.rgba(), ratio)
+        if self._layer is None or key != self._layerKey:
+            layer = QPixmap(visible.size() * ratio)
+            if ratio != 1.0:
+                layer.setDevicePixelRatio(ratio)
+            layer.fill(Qt.transparent)
+            p = QPainter(layer)
+            p.setRenderHint(QPainter.Antialiasing)
+            p.setRenderHint(QPainter.HighQualityAntialiasing)
+            p.setRenderHint(QPainter.SmoothPixmapTransform)
+            p.translate(-QPointF(visible.topLeft()))
+            p.scale(self.scale, self.scale)
+            p.translate(self.offsetToCenter())
+            exposed = QRectF(visible)
+            exposed = QRectF(self.transformPos(exposed.topLeft()),
+                             self.transformPos(exposed.bottomRight()))
+            self.paintStatic(p, exposed, skip=self._activeShapes)
+            p.end()
+            self._layer, self._layerKey = layer, key
+        return self._layer
+
+    def updateShapes(self, *shapes):
+        """Schedule a repaint of the area the given shapes cover. Call it
+        before and after changing a shape to also clear its old place."""
+        for shape in shapes:
+            if shape is not None and len(shape):
+                self.update(self.widgetRect(shape.boundingRect()))
+                if self._layer is not None and shape not in self._activeShapes \
+                        and shape not in (self.current, self.line,
+                                          self.selectedShapeCopy):
+                    # A pre-rendered shape changed.
+                    self.invalidateLayer()
+
+    def widgetRect(self, rect):
+        """Map a rectangle in image coordinates to widget coordinates,
+        grown by the room vertex markers and pens take around shapes."""
+        s, o = self.scale, self.offsetToCenter()
+        m = 2 * Shape.point_size + 4 * max(1.0, s)
+        return QRectF((rect.x() + o.x()) * s - m, (rect.y() + o.y()) * s - m,
+                      rect.width() * s + 2 * m,
+                      rect.height() * s + 2 * m).toAlignedRect()
+
     def transformPos(self, point):
         """Convert from widget-logical coordinates to painter-logical coordinates."""
         return point / self.scale - self.offsetToCenter()
@@ -541,98 +681,48 @@ class Canvas(QWidget):
     def offsetToCenter(self):
         s = self.scale
         area = super(Canvas, self).size()
-        w, h = self.pixmap.width() * s, self.pixmap.height() * s
+        size = self.imageSize()
+        w, h = size.width() * s, size.height() * s
         aw, ah = area.width(), area.height()
         x = (aw-w)/(2*s) if aw > w else 0
         y = (ah-h)/(2*s) if ah > h else 0
         return QPointF(x, y)
 
     def outOfPixmap(self, p):
-        w, h = self.pixmap.width(), self.pixmap.height()
+        size = self.imageSize()
+        w, h = size.width(), size.height()
         return not (0 <= p.x() <= w and 0 <= p.y() <= h)
 
     def finalise(self):
         assert self.current
         self.current.close()
         self.shapes.append(self.current)
+        self.shapeIndex.insert(self.current)
+        self.updateShapes(self.current, self.line)
+        self.endInteraction()
         self.current = None
         self.setHiding(False)
         self.newShape.emit(self.id)
-        self.update()
 
-    def updateCanvasLinesAndPoints(self):
-        self.points = []
-        self.lines = []
-        for shape_idx, shape in enumerate(self.shapes):
-            if self.hShape is not None and shape is self.hShape and not shape.isClosed():
-                continue
-            idxList = {}
+    def setEdgeGraphDirty(self):
+        self._edgeGraphDirty = True
 
-            for idx, point in enumerate(shape.points):
-                if point not in self.points:
-                    self.points.append(point)
-                    idxList[idx] = len(self.points) - 1
-                else:
-                    idxList[idx] = self.points.index(point)
-
-            for i in range(len(shape.points)-1):
-                try:
-                    if (idxList[i], idxList[i+1]) not in self.lines:
-                        self.lines.append((idxList[i], idxList[i+1]))
-                except KeyError:
-                    print ("keyError ", len(shape.points), len(shape.lines))
-        # print(self.points)
-        # print(self.lines)
+    def updateEdgeGraph(self):
+        """Re-read the shapes changed since the last call. This is only
+        needed for matching, so edits in the other modes merely flag the
+        graph as dirty."""
+        if self._edgeGraphDirty:
+            self.edgeGraph.sync(self.shapes)
+            self._edgeGraphDirty = False
 
     def pointOnLine(self, pos):
-        for line in self.lines:
-            e1 = pos - self.points[line[0]]
-            e2 = pos - self.points[line[1]]
-            e3 = self.points[line[0]] - self.points[line[1]]
-
-            len3 = e3.manhattanLength()
-            len1 = e1.manhattanLength()
-            len2 = e2.manhattanLength()
-
-            theta = np.arccos(QPointF.dotProduct(e1, e2)/(len1*len2 + self.lineEps)) / pi * 180
-            dist = np.fabs(e1.x()*e2.y()-e1.y()*e2.x()) / (len3 + self.lineEps)
-            # print('theta: {}, dist: {}'.format(theta, dist))
-            # if theta > min(150+len3/10., 170) and dist < len3 / 40.0:
-            if theta > 90 and dist < 2.0:
-                return line
-        return None
-
-        # point = self.points[t]
-        #
-        # lines = [[self.points[i][0], self.points[i][1], self.points[j][0],
-        #          self.points[j][1]] for i, j in self.lines if i != t and j != t]
-        # associated_lines = [(self.points[t][0], self.points[t][1], self.points[j][0], self.points[j][1]) for j in self.adj[t]]
-        #
-        # lengths = [sqrt((x1 - x2)**2 + (y1 - y2)**2) for x1, y1, x2, y2 in associated_lines]
-        # max_idx = lengths.index(max(lengths))
-        #
-        # point = np.array(point)
-        # pol = False
-        #
-        # for line in lines:
-        #     line = np.array(line)
-        #
-        #     x = point - line[:2]
-        #     y = point - line[2:4]
-        #     lenxy = np.linalg.norm(line[:2] - line[2:4])
-        #     lenx = np.sqrt(np.sum(np.square(x)))
-        #     leny = np.sqrt(np.sum(np.square(y)))
-        #
-        #     theta = np.arccos(np.divide(
-        #         np.inner(x, y),  np.multiply(lenx, leny) + eps)) / pi * 180
-        #     dist = np.linalg.norm(np.cross(x, y)) / (lenxy + eps)
-        #
-        #     if theta > min(150 +lenxy/10., 170) and dist < lenxy/40.0:
-        #         pol = True
-        #     else:
-        #         pol = False
-        # return pol
-
+        """Return the end points of the edge closest to `pos', if it is
+        within `lineEps'."""
+        self.updateEdgeGraph()
+        line = self.edgeGraph.pick(pos.x(), pos.y(), self.lineEps)
+        if line is None:
+            return None
+        return QPointF(*line[0]), QPointF(*line[1])
 
     def closeEnoughPoints(self, p1, points, index=None):
         assert(len(points) >= 1)
@@ -654,7 +744,7 @@ class Canvas(QWidget):
         # Cycle through each image edge in clockwise fashion,
         # and find the one intersecting the current line segment.
         # http://paulbourke.net/geometry/lineline2d/
-        size = self.pixmap.size()
+        size = self.imageSize()
         points = [(0,0),
                   (size.width(), 0),
                   (size.width(), size.height()),
@@ -704,8 +794,8 @@ class Canvas(QWidget):
         return self.minimumSizeHint()
 
     def minimumSizeHint(self):
-        if self.pixmap:
-            return self.scale * self.pixmap.size()
+        if self.hasImage():
+            return self.scale * self.imageSize()
         return super(Canvas, self).minimumSizeHint()
 
     def wheelEvent(self, ev):
@@ -735,9 +825,10 @@ class Canvas(QWidget):
     def keyPressEvent(self, ev):
         key = ev.key()
         if key == Qt.Key_Escape and self.current:
+            self.updateShapes(self.current, self.line)
+            self.endInteraction()
             self.current = None
             self.drawingPolygon.emit(self.id, False)
-            self.update()
         elif key == Qt.Key_Return and self.canCloseShape():
             self.finalise()
             self.vertexUpdated.emit()
@@ -750,24 +841,52 @@ class Canvas(QWidget):
     def undoLastLine(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.shapeIndex.remove(self.current)
+        self.setEdgeGraphDirty()
         self.current.setOpen()
         self.line.points = [self.current[-1], self.current[0]]
+        self.updateShapes(self.current)
+        self.beginInteraction()
         self.drawingPolygon.emit(self.id, True)
 
-    def loadPixmap(self, pixmap):
+    def hasImage(self):
+        return self.tiles is not None or bool(self.pixmap)
+
+    def imageSize(self):
+        if self.tiles is not None:
+            return self.tiles.size()
+        if self.pixmap is None:
+            return QSize()
+        return self.pixmap.size()
+
+    def loadImage(self, image, levels=()):
+        """Load a QImage, through a tile pyramid if it is a large one, with
+        the `levels' built beforehand, if any."""
+        if image.width() * image.height() > self.tileThreshold:
+            self.loadPixmap(QPixmap(), TiledImage(image, levels))
+        else:
+            self.loadPixmap(QPixmap.fromImage(image))
+
+    def loadPixmap(self, pixmap, tiles=None):
         self.pixmap = pixmap
+        self.tiles = tiles
         self.shapes = []
-        self.repaint()
+        self.shapeIndex.reset()
+        self.setEdgeGraphDirty()
+        self.endInteraction()
+        self.update()
 
     def loadShapes(self, shapes):
         self.shapes = list(shapes)
+        self.shapeIndex.reset(self.shapes)
         self.current = None
-        self.repaint()
+        self.endInteraction()
+        self.update()
         self.vertexUpdated.emit()
 
     def setShapeVisible(self, shape, value):
         self.visible[shape] = value
-        self.repaint()
+        self.updateShapes(shape)
 
     def overrideCursor(self, cursor):
         self.restoreCursor()
@@ -777,7 +896,12 @@ class Canvas(QWidget):
     def restoreCursor(self):
         QApplication.restoreOverrideCursor()
 
+    def setPlaceholder(self, text):
+        self.placeholder = text
+        self.update()
+
     def resetState(self):
         self.restoreCursor()
         self.pixmap = None
+        self.tiles = None
         self.update()
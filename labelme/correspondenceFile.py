@@ -22,6 +22,8 @@ import json
 import os.path
 import sys
 
+from labelme.labelFile import atomicOpen
+
 PY2 = sys.version_info[0] == 2
 
 
@@ -60,15 +62,21 @@ class CorrespondenceFile(object):
                 # If there is no correspondence, skip it for god's sake
                 if len(shape.correspondence) == 0:
                     continue
-                self.crspdcById[shape.id] = shape.correspondence
+                self.crspdcById[shape.id] = dict(shape.correspondence)
 
 
     def save(self, crspdcByName, shapes, imagePath, filename=None):
+        assert(len(shapes) == 2)
         self.extractCorrespondence(shapes)
-        self.crspdcByName = crspdcByName
-        self.imagePath = imagePath
+        self.crspdcByName = list(crspdcByName)
+        self.imagePath = list(imagePath)
+        self.write(filename)
+
+    def write(self, filename=None):
+        """Write the correspondences last extracted, without touching the
+        shapes, so that it can be done off the GUI thread."""
+        imagePath = self.imagePath
         assert(len(self.imagePath) == 2)
-        assert(len(shapes) == 2)
         if filename is None:
             filename = CorrespondenceFile.getCrspdcFileFromNames(imagePath)
 
@@ -78,7 +86,7 @@ class CorrespondenceFile(object):
             imagePath=imagePath
         )
         try:
-            with open(filename, 'wb' if PY2 else 'w') as f:
+            with atomicOpen(filename, 'wb' if PY2 else 'w') as f:
                 json.dump(data, f, ensure_ascii=True, indent=2)
         except Exception as e:
             raise CorrespondenceFileError(e)
@@ -0,0 +1,163 @@
+#
+# Copyright (C) 2011 Michael Pitidis, Hussein Abdulwahid.
+#
+# This file is part of Labelme.
+#
+# Labelme is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Labelme is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Labelme.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from math import floor
+
+import numpy as np
+
+
+def pointKey(point):
+    return (point.x(), point.y())
+
+
+def edgeKey(p1, p2):
+    """Direction-less key of the edge between two (x, y) tuples."""
+    return (p1, p2) if p1 <= p2 else (p2, p1)
+
+
+class EdgeGraph(object):
+    """Junctions and edges of the canvas shapes, keyed by coordinates.
+
+    Vertices shared by several shapes collapse into one junction, and
+    every edge maps back to the (shape, edge index) pairs drawing it, so
+    looking up the owner of an edge is a dictionary access. The graph is
+    maintained shape by shape: only shapes whose `version' changed since
+    the last sync are re-read.
+
+    For picking, the edge end points are packed into NumPy arrays and
+    bucketed in a uniform grid, see pick().
+    """
+    cellSize = 64.0
+    maxCells = 64
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # (x, y) -> number of shape vertices lying there.
+        self.junctions = {}
+        # edge key -> list of (shape, edge index).
+        self.edges = {}
+        # shape -> (stamp, junction keys, edge keys) as of the last
+        # update, so a shape can be taken out after it changed.
+        self._shapes = {}
+        self._segments = None
+
+    def sync(self, shapes):
+        """Bring the graph in line with the given list of shapes."""
+        current = set(shapes)
+        for shape in [s for s in self._shapes if s not in current]:
+            self.remove(shape)
+        for shape in shapes:
+            self.update(shape)
+
+    def update(self, shape):
+        stamp = (shape.version, shape.isClosed())
+        state = self._shapes.get(shape)
+        if state is not None and state[0] == stamp:
+            return
+        self.remove(shape)
+        points, keys = [], []
+        if shape.isClosed():
+            points = [pointKey(p) for p in shape.points]
+            for p in points:
+                self.junctions[p] = self.junctions.get(p, 0) + 1
+            for i in range(len(points) - 1):
+                if points[i] == points[i+1]:
+                    continue
+                key = edgeKey(points[i], points[i+1])
+                if key not in self.edges:
+                    self.edges[key] = []
+                    self._segments = None
+                self.edges[key].append((shape, i))
+                keys.append(key)
+        self._shapes[shape] = (stamp, points, keys)
+
+    def remove(self, shape):
+        state = self._shapes.pop(shape, None)
+        if state is None:
+            return
+        _, points, keys = state
+        for p in points:
+            self.junctions[p] -= 1
+            if not self.junctions[p]:
+                del self.junctions[p]
+        for key in keys:
+            owners = [o for o in self.edges[key] if o[0] is not shape]
+            if owners:
+                self.edges[key] = owners
+            else:
+                del self.edges[key]
+                self._segments = None
+
+    def owners(self, p1, p2):
+        """(shape, edge index) pairs drawing the edge between two points."""
+        return self.edges.get(edgeKey(pointKey(p1), pointKey(p2)), [])
+
+    def pick(self, x, y, tolerance):
+        """Return the key of the edge closest to (x, y), if it lies within
+        `tolerance', else None."""
+        if self._segments is None:
+            self._buildSegments()
+        keys, segments, cells, large = self._segments
+        if not keys:
+            return None
+        ix0, iy0 = self._cell(x - tolerance, y - tolerance)
+        ix1, iy1 = self._cell(x + tolerance, y + tolerance)
+        candidates = [large]
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                if (ix, iy) in cells:
+                    candidates.append(cells[ix, iy])
+        candidates = np.unique(np.concatenate(candidates))
+        if not len(candidates):
+            return None
+        seg = segments[candidates]
+        p1, d = seg[:, :2], seg[:, 2:] - seg[:, :2]
+        e = np.array([x, y]) - p1
+        t = np.clip((e * d).sum(axis=1) / (d * d).sum(axis=1), 0, 1)
+        dist = np.hypot(*(e - t[:, None] * d).T)
+        best = dist.argmin()
+        if dist[best] > tolerance:
+            return None
+        return keys[candidates[best]]
+
+    def _cell(self, x, y):
+        return int(floor(x / self.cellSize)), int(floor(y / self.cellSize))
+
+    def _buildSegments(self):
+        keys = list(self.edges)
+        segments = np.array([k[0] + k[1] for k in keys],
+                            dtype=np.float64).reshape(-1, 4)
+        lo = np.floor(np.minimum(segments[:, :2], segments[:, 2:]) /
+                      self.cellSize).astype(int)
+        hi = np.floor(np.maximum(segments[:, :2], segments[:, 2:]) /
+                      self.cellSize).astype(int)
+        ncells = np.prod(hi - lo + 1, axis=1)
+        cells = {}
+        for i in np.flatnonzero(ncells <= self.maxCells):
+            for ix in range(lo[i, 0], hi[i, 0] + 1):
+                for iy in range(lo[i, 1], hi[i, 1] + 1):
+                    cells.setdefault((ix, iy), []).append(i)
+        cells = dict((c, np.array(v)) for c, v in cells.items())
+        large = np.flatnonzero(ncells > self.maxCells)
+        self._segments = keys, segments, cells, large
+
+    def __len__(self):
+        return len(self.edges)
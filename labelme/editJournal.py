@@ -0,0 +1,199 @@
+#
+# Copyright (C) 2011 Michael Pitidis, Hussein Abdulwahid.
+#
+# This file is part of Labelme.
+#
+# Labelme is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Labelme is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Labelme.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+from collections import OrderedDict
+import json
+import os
+import os.path
+
+from labelme.labelFile import atomicOpen
+from labelme.shape import Shape
+
+
+class EditJournal(object):
+    """Append-only log of the edits made to the shapes of a label file.
+
+    Every call to record() compares the shapes with their state as of the
+    previous call and appends one JSON line per change: a shape added or
+    deleted, its points, label or colors changed, or one of its
+    correspondences added or removed. Geometry is only written out for
+    shapes whose `version' moved on.
+
+    The journal lives next to the label file. Saving the label file makes
+    the operations before the save redundant and they are dropped with
+    compact(); a journal left behind therefore holds the edits of a
+    session that ended without saving, which replay() applies on top of
+    the shapes of the label file.
+    """
+    suffix = '.journal'
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = None
+        # shape id -> (version, label, line color, fill color,
+        # correspondences) as of the last record() or sync().
+        self._state = {}
+
+    @classmethod
+    def forLabelFile(cls, filename):
+        return cls(filename + cls.suffix)
+
+    def exists(self):
+        return os.path.isfile(self.filename) and\
+                os.path.getsize(self.filename) > 0
+
+    def sync(self, shapes):
+        """Take the shapes as they are as the state the next record() is
+        compared against, without writing anything."""
+        self._state = dict((s.id, self._stamp(s)) for s in shapes)
+
+    def record(self, shapes):
+        ops = []
+        current = set()
+        for shape in shapes:
+            current.add(shape.id)
+            old = self._state.get(shape.id)
+            new = self._stamp(shape)
+            if new == old:
+                continue
+            self._state[shape.id] = new
+            version, label, lineColor, fillColor, crspdc = new
+            if old is None:
+                ops.append(dict(op='add', id=shape.id, label=label,
+                                points=self._points(shape),
+                                line_color=lineColor, fill_color=fillColor))
+                old = (version, label, lineColor, fillColor, {})
+            if old[0] != version:
+                ops.append(dict(op='points', id=shape.id,
+                                points=self._points(shape)))
+            if old[1] != label:
+                ops.append(dict(op='label', id=shape.id, label=label))
+            if old[2:4] != (lineColor, fillColor):
+                ops.append(dict(op='color', id=shape.id,
+                                line_color=lineColor, fill_color=fillColor))
+            for name, edge in crspdc.items():
+                if old[4].get(name) != edge:
+                    ops.append(dict(op='crspdc_add', id=shape.id,
+                                    name=name, edge=edge))
+            for name in old[4]:
+                if name not in crspdc:
+                    ops.append(dict(op='crspdc_remove', id=shape.id,
+                                    name=name))
+        for id in [id for id in self._state if id not in current]:
+            del self._state[id]
+            ops.append(dict(op='delete', id=id))
+        if ops:
+            if self._file is None:
+                self._file = open(self.filename, 'a')
+            self._file.write(''.join(json.dumps(op) + '\n' for op in ops))
+            self._file.flush()
+        return len(ops)
+
+    def mark(self):
+        """Position in the journal, to be handed to compact() once the
+        state recorded so far is saved."""
+        if self._file is not None:
+            return self._file.tell()
+        return os.path.getsize(self.filename) if self.exists() else 0
+
+    def compact(self, mark, filename=None):
+        """Drop the operations before `mark', optionally moving the
+        journal to `filename'."""
+        self.close()
+        filename = filename or self.filename
+        tail = b''
+        if self.exists():
+            with open(self.filename, 'rb') as f:
+                f.seek(mark)
+                tail = f.read()
+        if filename != self.filename:
+            self.discard()
+            self.filename = filename
+        if tail:
+            with atomicOpen(self.filename, 'wb') as f:
+                f.write(tail)
+        else:
+            self.discard()
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self):
+        ops = []
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    # The last line of a journal cut short by a crash.
+                    break
+        return ops
+
+    @staticmethod
+    def replay(shapes, ops):
+        """Apply the operations to shapes given as (label, points, line
+        color, fill color, id) tuples, as loaded from a label file.
+
+        Returns the resulting shapes and the correspondence changes, as
+        (shape id, name, edge) triples with an edge of None for removals.
+        """
+        shapes = OrderedDict((s[4], list(s)) for s in shapes)
+        crspdc = []
+        for op in ops:
+            shape = shapes.get(op['id'])
+            if op['op'] == 'add':
+                shapes[op['id']] = [op['label'], op['points'],
+                                    op['line_color'], op['fill_color'],
+                                    op['id']]
+            elif shape is None:
+                continue
+            elif op['op'] == 'delete':
+                del shapes[op['id']]
+            elif op['op'] == 'points':
+                shape[1] = op['points']
+            elif op['op'] == 'label':
+                shape[0] = op['label']
+            elif op['op'] == 'color':
+                shape[2], shape[3] = op['line_color'], op['fill_color']
+            elif op['op'] == 'crspdc_add':
+                crspdc.append((op['id'], op['name'], op['edge']))
+            elif op['op'] == 'crspdc_remove':
+                crspdc.append((op['id'], op['name'], None))
+        return [tuple(s) for s in shapes.values()], crspdc
+
+    @staticmethod
+    def _stamp(shape):
+        lineColor = shape.line_color.getRgb()\
+                if shape.line_color != Shape.line_color else None
+        fillColor = shape.fill_color.getRgb()\
+                if shape.fill_color != Shape.fill_color else None
+        return (shape.version, shape.label, lineColor, fillColor,
+                dict(shape.correspondence))
+
+    @staticmethod
+    def _points(shape):
+        return [(p.x(), p.y()) for p in shape.points]
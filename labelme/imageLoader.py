@@ -0,0 +1,359 @@
+#
+# Copyright (C) 2011 Michael Pitidis, Hussein Abdulwahid.
+#
+# This file is part of Labelme.
+#
+# Labelme is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Labelme is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Labelme.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from collections import OrderedDict
+from functools import partial
+import os
+import os.path
+import threading
+
+try:
+    from PyQt5.QtGui import *
+    from PyQt5.QtCore import *
+except ImportError:
+    from PyQt4.QtGui import *
+    from PyQt4.QtCore import *
+
+from labelme.labelFile import LabelFile, LabelFileError
+from labelme.binaryLabelFile import BinaryLabelFile
+from labelme.tiledImage import TiledImage
+from labelme.worker import Worker
+
+
+class ImageLoadError(Exception):
+    pass
+
+
+def labelFileType(filename):
+    for cls in (LabelFile, BinaryLabelFile):
+        if cls.isLabelFile(filename):
+            return cls
+    return None
+
+
+def imageFormats():
+    return ['.%s' % fmt.data().decode()
+            for fmt in QImageReader.supportedImageFormats()]
+
+
+def imageFiles(dirname):
+    """The images and label files in `dirname' that can be opened, one per
+    image: the image itself, or its label file if there is no image file,
+    sorted by name."""
+    formats = imageFormats()
+    files = {}
+    for name in sorted(os.listdir(dirname)):
+        base, ext = os.path.splitext(name)
+        ext = ext.lower()
+        if ext in formats:
+            files[base] = name
+        elif labelFileType(name) is not None:
+            files.setdefault(base, name)
+    return [os.path.join(dirname, files[base]) for base in sorted(files)]
+
+
+def fileStamp(filename):
+    """What tells whether a file changed: its modification time and size,
+    or None if it does not exist."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+def decodeImage(imageData):
+    """Decode the data of an image file into a QImage, which is null if it
+    is not a valid image.
+
+    Unlike QImage.fromData, QImageReader lets other Python threads run
+    while decoding, so that decoding on a thread pool does not stall the
+    GUI thread."""
+    buf = QBuffer()
+    buf.setData(imageData)
+    buf.open(QIODevice.ReadOnly)
+    return QImageReader(buf).read()
+
+
+def read(filename, default=None):
+    try:
+        with open(filename, 'rb') as f:
+            return f.read()
+    except:
+        return default
+
+
+class LoadedImage(object):
+    """An image, or label file and its image, read and decoded, with the
+    lower levels of its tile pyramid if it is a large one."""
+
+    def __init__(self, filename, labelFile, imageData, imagePath, image,
+                 shapes, stamps, levels=()):
+        self.filename = filename
+        self.labelFile = labelFile
+        self.imageData = imageData
+        self.imagePath = imagePath
+        self.image = image
+        self.shapes = shapes
+        self.stamps = stamps
+        self.levels = levels
+
+    @property
+    def nbytes(self):
+        return len(self.imageData) + sum(
+            image.bytesPerLine() * image.height()
+            for image in [self.image] + list(self.levels))
+
+    def isCurrent(self):
+        """Whether none of the files it was read from changed since."""
+        return all(fileStamp(f) == stamp for f, stamp in self.stamps)
+
+
+class ImageCache(object):
+    """LRU cache of decoded images, bounded by `budget' bytes.
+
+    Entries are looked up by the path of the file the image data was read
+    from, an image or a label file embedding it, and are only used if the
+    files they were read from did not change since, by modification time
+    and size. Along with the image, they keep the hash of its data once
+    checked against a label file. It is shared by all threads, and `hits'
+    and `misses' count the lookups, to tune the budget.
+    """
+
+    def __init__(self, budget=256 * 1024 * 1024):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """The (image data, QImage, hash or None) cached for `filename', or
+        None."""
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and \
+               all(fileStamp(f) == stamp for f, stamp in entry[0]):
+                # Most recently used last.
+                self._entries[filename] = self._entries.pop(filename)
+                self.hits += 1
+                return entry[1], entry[2], entry[4]
+            self.misses += 1
+            return None
+
+    def put(self, filename, stamps, imageData, image, imageHash=None):
+        """Cache the image data and QImage read from `stamps', a list of
+        (path, fileStamp(path)) of the files read."""
+        nbytes = len(imageData) + image.bytesPerLine() * image.height()
+        with self._lock:
+            self._remove(filename)
+            if nbytes > self.budget:
+                return
+            self._entries[filename] = (stamps, imageData, image, nbytes,
+                                       imageHash)
+            self.nbytes += nbytes
+            while self.nbytes > self.budget:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _remove(self, filename):
+        entry = self._entries.pop(filename, None)
+        if entry is not None:
+            self.nbytes -= entry[3]
+
+
+# Shared by all the images opened in the process.
+imageCache = ImageCache()
+
+
+def loadImageFile(filename, cache=imageCache):
+    """Read and decode an image, or a label file and its image, the label
+    file next to the image being used if there is one. The image is taken
+    from `cache' if it is there, and added to it otherwise.
+
+    It only uses what is safe off the GUI thread, to run on a thread pool.
+    Raises ImageLoadError, with a message for the user, on failure.
+    """
+    if labelFileType(filename) is None:
+        for cls in (LabelFile, BinaryLabelFile):
+            if os.path.exists(cls.getLabelFileFromName(filename)):
+                filename = cls.getLabelFileFromName(filename)
+                break
+    stamps = [(filename, fileStamp(filename))]
+    if labelFileType(filename) is not None:
+        try:
+            # Lazy, so that the image data is not even read when cached.
+            labelFile = labelFileType(filename)(filename, lazy=True)
+            shapes = list(labelFile.shapes)
+            imagePath = LabelFile.resolveImagePath(filename,
+                                                   labelFile.imagePath)
+            stamps.append((imagePath, fileStamp(imagePath)))
+            # An image in a file of its own is cached by its path, so that
+            # saving the labels does not make it decoded again.
+            key = labelFile.imageFile or filename
+            imageHash = labelFile.imageHash
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                labelFile.imageData, image, cachedHash = cached
+                if imageHash is not None and imageHash != cachedHash:
+                    # Cached when opened by itself, and not checked yet.
+                    LabelFile.checkImage(key, labelFile.imageData, imageHash)
+                    cached = None
+            else:
+                # FIXME: PyQt4 installed via Anaconda fails to load JPEG
+                # and JSON encoded images.
+                # https://github.com/ContinuumIO/anaconda-issues/issues/131
+                image = decodeImage(labelFile.imageData)
+                if image.isNull():
+                    raise LabelFileError(
+                        'Failed loading image data from label file.\n'
+                        'Maybe this is a known issue of PyQt4 built on'
+                        ' Anaconda, and may be fixed by installing PyQt5.')
+        except Exception as e:
+            # Shapes missing fields only fail once they are listed.
+            raise ImageLoadError(
+                "<p><b>%s</b></p>"
+                "<p>Make sure <i>%s</i> is a valid label file." % (e, filename))
+        imageData = labelFile.imageData
+    else:
+        # Read the data first and keep it for saving into the label file.
+        labelFile = None
+        shapes = []
+        imagePath = key = filename
+        imageHash = None
+        cached = cache.get(key) if cache is not None else None
+        for cls in (LabelFile, BinaryLabelFile):
+            labelPath = cls.getLabelFileFromName(filename)
+            stamps.append((labelPath, None))
+        if cached is not None:
+            imageData, image, _ = cached
+        else:
+            imageData = read(filename, None)
+            image = decodeImage(imageData) if imageData is not None\
+                    else QImage()
+        if image.isNull():
+            raise ImageLoadError(
+                '<p>Make sure <i>{0}</i> is a valid image file.<br/>'
+                'Supported image formats: {1}</p>'.format(
+                    filename, ','.join('*' + f for f in imageFormats())))
+    if cached is None and cache is not None:
+        # Only the file the image was read from matters, stamped before
+        # reading it. Its hash, if any, was checked on reading it.
+        cache.put(key, [stamp for stamp in stamps if stamp[0] == key],
+                  imageData, image, imageHash)
+    # Built here rather than when first drawn, on the GUI thread.
+    levels = TiledImage.buildLevels(image)\
+            if image.width() * image.height() > TiledImage.threshold else ()
+    return LoadedImage(filename, labelFile, imageData, imagePath, image,
+                       shapes, stamps, levels)
+
+
+class Prefetcher(QObject):
+    """Load image files ahead of time on a thread pool.
+
+    The loaded files are kept until taken, or until they are no longer
+    wanted. As many files are loaded at a time as the pool has threads,
+    and no more are started once the loaded ones take `budget' bytes. When
+    a load ends over budget, the loaded files wanted last are given up, and
+    not loaded again until some memory is taken.
+    """
+
+    def __init__(self, budget=512 * 1024 * 1024, threads=2, parent=None):
+        super(Prefetcher, self).__init__(parent)
+        self.budget = budget
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(threads)
+        self.wanted = []
+        self.loading = {}
+        self.loaded = OrderedDict()
+        self.failed = set()
+        self.evicted = set()
+        self.nbytes = 0
+
+    def prefetch(self, filenames):
+        """Load `filenames', in order, instead of those asked for before."""
+        self.wanted = list(filenames)
+        for filename in list(self.loaded):
+            if filename not in self.wanted:
+                self.drop(filename)
+        self.failed &= set(self.wanted)
+        self.evicted &= set(self.wanted)
+        self.fill()
+
+    def take(self, filename):
+        """The LoadedImage of `filename', which is given up, or None if it
+        is not loaded yet or changed since."""
+        if filename in self.wanted:
+            self.wanted.remove(filename)
+        loaded = self.drop(filename)
+        if loaded is not None:
+            self.evicted.clear()
+        if loaded is not None and not loaded.isCurrent():
+            loaded = None
+        self.fill()
+        return loaded
+
+    def clear(self):
+        self.prefetch([])
+
+    def drop(self, filename):
+        loaded = self.loaded.pop(filename, None)
+        if loaded is not None:
+            self.nbytes -= loaded.nbytes
+        return loaded
+
+    def fill(self):
+        for filename in self.wanted:
+            if len(self.loading) >= self.pool.maxThreadCount()\
+               or self.nbytes >= self.budget:
+                break
+            if filename in self.loaded or filename in self.loading\
+               or filename in self.failed or filename in self.evicted:
+                continue
+            worker = Worker(loadImageFile, filename)
+            worker.signals.finished.connect(partial(self.finished, filename))
+            worker.signals.failed.connect(partial(self.loadFailed, filename))
+            self.loading[filename] = worker
+            self.pool.start(worker)
+
+    def finished(self, filename, loaded):
+        del self.loading[filename]
+        if filename in self.wanted:
+            self.loaded[filename] = loaded
+            self.nbytes += loaded.nbytes
+            # Other loads may have ended since this one started.
+            while self.nbytes > self.budget:
+                last = max(self.loaded, key=self.wanted.index)
+                self.drop(last)
+                self.evicted.add(last)
+        self.fill()
+
+    def loadFailed(self, filename, _message):
+        # Left for loading on demand, which reports the error.
+        del self.loading[filename]
+        self.failed.add(filename)
+        self.fill()
+
+    def waitForDone(self):
+        self.pool.waitForDone()
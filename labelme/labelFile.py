@@ -18,67 +18,288 @@
 #
 
 from base64 import b64encode, b64decode
+from contextlib import contextmanager
+from functools import partial
+import hashlib
 import json
+import os
 import os.path
+import re
+import shutil
 import sys
+import tempfile
 
 
 PY2 = sys.version_info[0] == 2
 
+_imageDataKey = re.compile(br'(?<!\\)"imageData"\s*:\s*"')
+# Base64, possibly with escapes, as in "\n" or "\/".
+_base64Run = re.compile(br'[A-Za-z0-9+/=\\]*')
+
 
 class LabelFileError(Exception):
     pass
 
+
+class NotLabelFileError(LabelFileError):
+    """The file is not a label file, such as some other JSON document."""
+
+
+@contextmanager
+def atomicOpen(filename, mode='w'):
+    """Open a temporary file next to `filename', which replaces it once
+    the block completes, so that the file is never left half written."""
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % basename, suffix='.tmp',
+                               dir=dirname)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        if os.path.exists(filename):
+            shutil.copymode(filename, tmp)
+        else:
+            # The umask can only be queried by changing it.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+        if hasattr(os, 'replace'):
+            os.replace(tmp, filename)
+        else:
+            os.rename(tmp, filename)
+    except:
+        os.remove(tmp)
+        raise
+
+
+def scanLabelFile(filename, chunkSize=1 << 20):
+    """Parse a label file without its base64 image data.
+
+    The file is read in chunks up to the imageData string, and from its end
+    back to the end of the string, see _findBase64End, so that the string
+    is neither read, buffered nor parsed. Returns the document, with
+    imageData set to None, and the (offset, length) of the base64 string
+    in the file, or None if the file has no image data.
+    """
+    parts = []
+    span = None
+    with open(filename, 'rb') as f:
+        buf = b''
+        while True:
+            chunk = f.read(chunkSize)
+            buf += chunk
+            m = _imageDataKey.search(buf)
+            if m is not None or not chunk:
+                break
+            # Keep enough of the tail for a key split across two chunks.
+            keep = max(0, len(buf) - 64)
+            parts.append(buf[:keep])
+            buf = buf[keep:]
+        if m is None:
+            parts.append(buf)
+        else:
+            parts.append(buf[:m.start()])
+            parts.append(b'"imageData": null')
+            offset = f.tell() - len(buf) + m.end()
+            end = _findBase64End(f, offset, chunkSize)
+            if end is None:
+                # Not plain base64, look for the end from the start.
+                f.seek(offset)
+                end = offset
+                while True:
+                    buf = f.read(chunkSize)
+                    if not buf:
+                        raise LabelFileError('Unterminated imageData in %s'
+                                             % filename)
+                    if b'"' in buf:
+                        end += buf.index(b'"')
+                        break
+                    end += len(buf)
+            span = offset, end - offset
+            f.seek(end + 1)
+            parts.append(f.read())
+    data = json.loads(b''.join(parts).decode('utf-8'))
+    return data, span
+
+
+def _findBase64End(f, offset, chunkSize=1 << 20, minRun=1024):
+    """Offset of the quote ending the base64 string at `offset' in file
+    `f', found by reading the file backwards from its end.
+
+    Base64 has no quotes, so the string ends at the first quote of the
+    tail read once at least `minRun' base64 characters precede it, which
+    other strings of a label file do not have; the string itself is not
+    read. Returns None if the string is not plain base64.
+    """
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    tail = b''
+    while pos > offset:
+        size = min(chunkSize, pos - offset)
+        pos -= size
+        f.seek(pos)
+        tail = f.read(size) + tail
+        end = _base64Run.match(tail).end()
+        if tail[end:end + 1] == b'"' and (end >= minRun or pos == offset):
+            return pos + end
+    return None
+
+
 class LabelFile(object):
     suffix = '.json'
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, lazy=False):
         self.shapes = ()
         self.imagePath = None
         self.imageData = None
+        # The image file read, None if the image is embedded, and the hash
+        # of its data, checked on load and kept so as not to hash it again
+        # on every save.
+        self.imageFile = None
+        self.imageHash = None
         if filename is not None:
-            self.load(filename)
+            self.load(filename, lazy=lazy)
+
+    @property
+    def imageData(self):
+        if self._imageSource is not None:
+            try:
+                self._imageData = self._imageSource()
+            except LabelFileError:
+                raise
+            except Exception as e:
+                raise LabelFileError(e)
+            self._imageSource = None
+        return self._imageData
+
+    @imageData.setter
+    def imageData(self, imageData):
+        self._imageData = imageData
+        self._imageSource = None
 
-    def load(self, filename):
+    def load(self, filename, lazy=False):
+        """Read the labels from `filename'. With lazy, the image data is
+        not read until `imageData' is first accessed."""
         try:
-            with open(filename, 'rb' if PY2 else 'r') as f:
-                data = json.load(f)
-                imagePath = data['imagePath']
-                imageData = b64decode(data['imageData'])
-                lineColor = data['lineColor']
-                fillColor = data['fillColor']
-                shapes = ((s['label'], s['points'], s['line_color'], s['fill_color'], s['shape_id'])\
-                        for s in data['shapes'])
-                # Only replace data after everything is loaded.
-                self.shapes = shapes
-                self.imagePath = imagePath
-                self.imageData = imageData
-                self.lineColor = lineColor
-                self.fillColor = fillColor
+            if lazy:
+                data, span = scanLabelFile(filename)
+            else:
+                with open(filename, 'rb' if PY2 else 'r') as f:
+                    data = json.load(f)
+                span = None
+            imagePath = data['imagePath']
+            imageFile = imageHash = None
+            if span is not None:
+                imageSource = partial(self.readImageData, filename, *span)
+            elif data.get('imageData') is not None:
+                imageSource = partial(b64decode, data['imageData'])
+            else:
+                imageFile = self.resolveImagePath(filename, imagePath)
+                imageHash = data.get('imageHash')
+                imageSource = partial(self.readImageFile, imageFile,
+                                      imageHash)
+            imageData = None if lazy else imageSource()
+            lineColor = data['lineColor']
+            fillColor = data['fillColor']
+            shapes = ((s['label'], s['points'], s['line_color'], s['fill_color'], s['shape_id'])\
+                    for s in data['shapes'])
+            # Only replace data after everything is loaded.
+            self.shapes = shapes
+            self.imagePath = imagePath
+            self.imageFile = imageFile
+            self.imageHash = imageHash
+            self.imageData = imageData
+            if lazy:
+                self._imageSource = imageSource
+            self.lineColor = lineColor
+            self.fillColor = fillColor
+        except LabelFileError:
+            raise
         except Exception as e:
             raise LabelFileError(e)
 
-    def save(self, filename, shapes, imagePath, imageData,
-            lineColor=None, fillColor=None):
+    @staticmethod
+    def readImageData(filename, offset, length):
+        """Decode the base64 image data found at `offset' in a label file."""
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            return b64decode(f.read(length))
+
+    @staticmethod
+    def readImageFile(imagePath, imageHash=None):
+        with open(imagePath, 'rb') as f:
+            imageData = f.read()
+        LabelFile.checkImage(imagePath, imageData, imageHash)
+        return imageData
+
+    @staticmethod
+    def checkImage(imagePath, imageData, imageHash):
+        """Raise LabelFileError unless the data of the image file has the
+        hash, if any, of the one the labels were made on."""
+        if imageHash is not None and imageHash != LabelFile.hashImage(imageData):
+            raise LabelFileError(
+                'Image file %s does not match the one the labels were made on'
+                % imagePath)
+
+    @staticmethod
+    def hashImage(imageData):
+        return 'sha1:' + hashlib.sha1(imageData).hexdigest()
+
+    @classmethod
+    def document(cls, filename, shapes, imagePath, imageData,
+            lineColor=None, fillColor=None, storeData=True,
+            imageHeight=None, imageWidth=None, imageHash=None):
+        """The contents of a label file as a dict, with the image data, if
+        stored, as raw bytes. `imageHash' is that of the image data, if
+        known already."""
         data = dict(
             shapes=shapes,
             lineColor=lineColor,
             fillColor=fillColor,
             imagePath=imagePath,
-            imageData=b64encode(imageData).decode('utf-8'),
+            imageData=None,
         )
+        if storeData:
+            data['imageData'] = imageData
+        else:
+            data['imagePath'] = os.path.relpath(
+                imagePath, os.path.dirname(os.path.abspath(filename)))
+            data['imageHash'] = imageHash or cls.hashImage(imageData)
+        if imageHeight is not None and imageWidth is not None:
+            data['imageHeight'] = imageHeight
+            data['imageWidth'] = imageWidth
+        return data
+
+    def save(self, filename, shapes, imagePath, imageData,
+            lineColor=None, fillColor=None, storeData=True,
+            imageHeight=None, imageWidth=None, imageHash=None):
+        """Write the labels to `filename'. With storeData the image is
+        embedded as base64, otherwise only its path, relative to the label
+        file, and a hash of its content are kept."""
+        data = self.document(filename, shapes, imagePath, imageData,
+                             lineColor, fillColor, storeData,
+                             imageHeight, imageWidth, imageHash)
+        if data['imageData'] is not None:
+            data['imageData'] = b64encode(data['imageData']).decode('utf-8')
         try:
-            with open(filename, 'wb' if PY2 else 'w') as f:
+            with atomicOpen(filename, 'wb' if PY2 else 'w') as f:
                 json.dump(data, f, ensure_ascii=True, indent=2)
         except Exception as e:
             raise LabelFileError(e)
+        self.imageHash = data.get('imageHash')
 
     @staticmethod
-    def isLabelFile(filename):
-        return os.path.splitext(filename)[1].lower() == LabelFile.suffix
+    def resolveImagePath(filename, imagePath):
+        """Path of the image a label file refers to. Relative paths are
+        relative to the label file."""
+        return os.path.join(os.path.dirname(os.path.abspath(filename)),
+                            imagePath)
 
-    @staticmethod
-    def getLabelFileFromName(filename):
+    @classmethod
+    def isLabelFile(cls, filename):
+        return os.path.splitext(filename)[1].lower() == cls.suffix
+
+    @classmethod
+    def getLabelFileFromName(cls, filename):
         base, ext = os.path.splitext(filename)
-        path = base + LabelFile.suffix
+        path = base + cls.suffix
         return path
@@ -28,8 +28,14 @@ except ImportError:
     from PyQt4.QtCore import *
 
 
+# Name -> QIcon, as most icons are used by several actions.
+_icons = {}
+
+
 def newIcon(icon):
-    return QIcon(':/' + icon)
+    if icon not in _icons:
+        _icons[icon] = QIcon(':/' + icon)
+    return _icons[icon]
 
 def newButton(text, icon=None, slot=None):
     b = QPushButton(text)
@@ -30,9 +30,6 @@ except ImportError:
 import random
 from .lib import distance
 
-# TODO:
-# - [opt] Store paths instead of creating new ones at each paint.
-
 DEFAULT_LINE_COLOR = QColor(0, 255, 0, 128)
 DEFAULT_FILL_COLOR = QColor(255, 0, 0, 128)
 DEFAULT_SELECT_LINE_COLOR = QColor(255, 255, 255)
@@ -62,6 +59,12 @@ class Shape(object):
         self.id = id or int(random.uniform(0, 9223372036854775807))
         # print(type(self.id))
         # print('A shape with id: {} spawned'.format(self.id))
+        # Bumped on every geometry change, see invalidate().
+        self.version = 0
+        self._cacheVersion = -1
+        self._path = None
+        self._fillPath = None
+        self._bbox = None
         self.points = []
         self.fill = False
         self.selected = False
@@ -84,6 +87,35 @@ class Shape(object):
             # is used for drawing the pending line a different color.
             self.line_color = line_color
 
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop the cached geometry. Must be called after writing to
+        `points' in place; the methods of this class already do it."""
+        self.version += 1
+
+    def _updateGeometry(self):
+        if self._cacheVersion == self.version:
+            return
+        path = QPainterPath()
+        if self.points:
+            path.moveTo(self.points[0])
+            for p in self.points[1:]:
+                path.lineTo(p)
+        fillPath = QPainterPath(path)
+        fillPath.closeSubpath()
+        self._path = path
+        self._fillPath = fillPath
+        self._bbox = path.boundingRect()
+        self._cacheVersion = self.version
+
     def close(self):
         assert len(self.points) >= 2
         # print("[DEBUG] Closeing shape with {} points".format(len(self.points)))
@@ -98,12 +130,15 @@ class Shape(object):
         if self.points and point == self.points[0]:
             to_close = True
         self.points.append(point)
+        self.invalidate()
         if to_close:
             self.close()
 
     def popPoint(self):
         if self.points:
-            return self.points.pop()
+            point = self.points.pop()
+            self.invalidate()
+            return point
         return None
 
     def isClosed(self):
@@ -122,28 +157,31 @@ class Shape(object):
             highlight_pen.setWidth(max(2, int(round(4.0 / self.scale))))
             painter.setPen(pen)
 
-            line_path = QPainterPath()
             vrtx_path = QPainterPath()
             line_highlightpath = QPainterPath()
 
-            line_path.moveTo(self.points[0])
             # Uncommenting the following line will draw 2 paths
             # for the 1st vertex, and make it non-filled, which
             # may be desirable.
             #self.drawVertex(vrtx_path, 0)
 
-            # for i, p in enumerate(self.points):
-            #     line_path.lineTo(p)
-            #     self.drawVertex(vrtx_path, i)
-            for i, p in enumerate(self.points):
-                self.drawVertex(vrtx_path, i)
-                if i == 0: continue
-                subp = QPainterPath(self.points[i-1])
-                subp.lineTo(self.points[i])
-                if self._highlightEdgeIndex == i-1 or self._selectedEdgeIndex == i-1:
-                    line_highlightpath.addPath(subp)
-                else:
-                    line_path.addPath(subp)
+            if self._highlightEdgeIndex is None and self._selectedEdgeIndex is None:
+                # Nothing to single out, the cached outline will do.
+                line_path = self.makePath()
+                for i in range(len(self.points)):
+                    self.drawVertex(vrtx_path, i)
+            else:
+                line_path = QPainterPath()
+                line_path.moveTo(self.points[0])
+                for i, p in enumerate(self.points):
+                    self.drawVertex(vrtx_path, i)
+                    if i == 0: continue
+                    subp = QPainterPath(self.points[i-1])
+                    subp.lineTo(self.points[i])
+                    if self._highlightEdgeIndex == i-1 or self._selectedEdgeIndex == i-1:
+                        line_highlightpath.addPath(subp)
+                    else:
+                        line_path.addPath(subp)
 
             # if self.isClosed():
             #     line_path.lineTo(self.points[0])
@@ -153,7 +191,7 @@ class Shape(object):
             painter.fillPath(vrtx_path, self.vertex_fill_color)
             if self.fill:
                 color = self.select_fill_color if self.selected else self.fill_color
-                painter.fillPath(line_path, color)
+                painter.fillPath(self.fillPath(), color)
             painter.setPen(highlight_pen)
             painter.drawPath(line_highlightpath)
 
@@ -176,28 +214,39 @@ class Shape(object):
             assert False, "unsupported vertex shape"
 
     def nearestVertex(self, point, epsilon):
+        self._updateGeometry()
+        if not self._bbox.adjusted(
+                -epsilon, -epsilon, epsilon, epsilon).contains(point):
+            return None
         for i, p in enumerate(self.points):
             if distance(p - point) <= epsilon:
                 return i
         return None
 
     def containsPoint(self, point):
-        return self.makePath().contains(point)
+        self._updateGeometry()
+        return self._bbox.contains(point) and self._path.contains(point)
+
+    # The cached geometry is handed out as copies, so that callers cannot
+    # change it; paths are implicitly shared, so copying them is cheap.
 
     def makePath(self):
-        path = QPainterPath(self.points[0])
-        for p in self.points[1:]:
-            path.lineTo(p)
-        return path
+        self._updateGeometry()
+        return QPainterPath(self._path)
+
+    def fillPath(self):
+        self._updateGeometry()
+        return QPainterPath(self._fillPath)
 
     def boundingRect(self):
-        return self.makePath().boundingRect()
+        self._updateGeometry()
+        return QRectF(self._bbox)
 
     def moveBy(self, offset):
         self.points = [p + offset for p in self.points]
 
     def moveVertexBy(self, i, offset):
-        self.points[i] = self.points[i] + offset
+        self[i] = self.points[i] + offset
 
     def highlightVertex(self, i, action):
         self._highlightIndex = i
@@ -233,3 +282,4 @@ class Shape(object):
 
     def __setitem__(self, key, value):
         self.points[key] = value
+        self.invalidate()
@@ -0,0 +1,139 @@
+#
+# Copyright (C) 2011 Michael Pitidis, Hussein Abdulwahid.
+#
+# This file is part of Labelme.
+#
+# Labelme is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Labelme is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Labelme.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from collections import defaultdict
+from math import floor
+
+
+class ShapeIndex(object):
+    """Uniform grid over the bounding boxes of the canvas shapes.
+
+    Every shape is bucketed into the grid cells its bounding box covers,
+    so hit-testing only has to look at the shapes near the cursor instead
+    of walking the whole shape list. Shapes covering too many cells are
+    kept aside and always returned as candidates.
+
+    The index also remembers the insertion order of the shapes, which is
+    the z-order of the canvas: the shapes are only ever appended to or
+    removed from `Canvas.shapes', never reordered.
+    """
+    cellSize = 128.0
+    maxCells = 256
+
+    def __init__(self, shapes=()):
+        self.reset(shapes)
+
+    def reset(self, shapes=()):
+        self._cells = defaultdict(set)
+        self._large = set()
+        self._keys = {}
+        self._versions = {}
+        self._order = {}
+        self._counter = 0
+        for shape in shapes:
+            self.insert(shape)
+
+    def insert(self, shape):
+        """Add a shape on top of the z-order."""
+        self._counter += 1
+        self._order[shape] = self._counter
+        self._keys[shape] = None
+        self._versions[shape] = None
+        self.update(shape)
+
+    def update(self, shape):
+        """Re-bucket a shape after its geometry changed."""
+        if self._versions.get(shape, shape.version) == shape.version:
+            return
+        self._versions[shape] = shape.version
+        key = self._cellRange(shape.boundingRect()) if len(shape) else None
+        if key == self._keys[shape]:
+            return
+        self._unbucket(shape)
+        self._keys[shape] = key
+        if key is None:
+            return
+        if key == 'large':
+            self._large.add(shape)
+            return
+        ix0, iy0, ix1, iy1 = key
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                self._cells[ix, iy].add(shape)
+
+    def remove(self, shape):
+        if shape not in self._keys:
+            return
+        self._unbucket(shape)
+        del self._keys[shape]
+        del self._versions[shape]
+        del self._order[shape]
+
+    def zOrder(self, shape):
+        return self._order.get(shape, 0)
+
+    def query(self, x0, y0, x1, y1):
+        """Return the shapes whose bounding box may intersect the given
+        rectangle, top-most first."""
+        ix0, iy0 = self._cell(x0, y0)
+        ix1, iy1 = self._cell(x1, y1)
+        found = set(self._large)
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                cell = self._cells.get((ix, iy))
+                if cell:
+                    found.update(cell)
+        return sorted(found, key=self._order.get, reverse=True)
+
+    def queryPoint(self, point, margin=0.0):
+        x, y = point.x(), point.y()
+        return self.query(x - margin, y - margin, x + margin, y + margin)
+
+    def _cell(self, x, y):
+        return int(floor(x / self.cellSize)), int(floor(y / self.cellSize))
+
+    def _cellRange(self, rect):
+        ix0, iy0 = self._cell(rect.left(), rect.top())
+        ix1, iy1 = self._cell(rect.right(), rect.bottom())
+        if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > self.maxCells:
+            return 'large'
+        return ix0, iy0, ix1, iy1
+
+    def _unbucket(self, shape):
+        key = self._keys.get(shape)
+        if key is None:
+            return
+        if key == 'large':
+            self._large.discard(shape)
+            return
+        ix0, iy0, ix1, iy1 = key
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                cell = self._cells.get((ix, iy))
+                if cell is None:
+                    continue
+                cell.discard(shape)
+                if not cell:
+                    del self._cells[ix, iy]
+
+    def __contains__(self, shape):
+        return shape in self._keys
+
+    def __len__(self):
+        return len(self._keys)
@@ -0,0 +1,130 @@
+#
+# Copyright (C) 2011 Michael Pitidis, Hussein Abdulwahid.
+#
+# This file is part of Labelme.
+#
+# Labelme is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Labelme is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Labelme.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from collections import OrderedDict
+from math import floor, ceil
+
+try:
+    from PyQt5.QtGui import *
+    from PyQt5.QtCore import *
+except ImportError:
+    from PyQt4.QtGui import *
+    from PyQt4.QtCore import *
+
+
+class TiledImage(object):
+    """Tile pyramid over an image too large to be drawn in one go.
+
+    Level 0 is the image itself and every further level halves the
+    previous one. The levels are best built beforehand, off the GUI
+    thread, see buildLevels; those missing are computed on first use.
+    Tiles are cut from them into pixmaps on demand. The pixmaps are kept
+    in an LRU cache bounded by `budget' bytes.
+    """
+    tileSize = 512
+    budget = 256 * 1024 * 1024
+    # Images with more pixels are drawn through a tile pyramid.
+    threshold = 4096 * 4096
+
+    def __init__(self, image, levels=()):
+        self._levels = [image] + list(levels)
+        self._tiles = OrderedDict()
+        self._bytes = 0
+
+    def width(self):
+        return self._levels[0].width()
+
+    def height(self):
+        return self._levels[0].height()
+
+    def size(self):
+        return self._levels[0].size()
+
+    def levelFor(self, scale):
+        """Coarsest level that still has at least one pixel per screen
+        pixel at the given scale."""
+        level = 0
+        size = max(self.width(), self.height())
+        while scale * 2 ** (level + 1) <= 1 and size > self.tileSize:
+            level += 1
+            size //= 2
+        return level
+
+    @classmethod
+    def buildLevels(cls, image):
+        """The levels below `image', down to those levelFor can pick. Only
+        QImage is used, so that it can run on any thread."""
+        levels = []
+        while max(image.width(), image.height()) > cls.tileSize:
+            image = cls._half(image)
+            levels.append(image)
+        return levels
+
+    @staticmethod
+    def _half(image):
+        return image.scaled(
+            max(1, image.width() // 2), max(1, image.height() // 2),
+            Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    def level(self, n):
+        while len(self._levels) <= n:
+            self._levels.append(self._half(self._levels[-1]))
+        return self._levels[n]
+
+    def tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        pixmap = self._tiles.pop(key, None)
+        if pixmap is None:
+            t = self.tileSize
+            image = self.level(level)
+            # Tiles at the right and bottom edges are cut short.
+            image = image.copy(QRect(tx * t, ty * t, t, t).intersected(
+                QRect(0, 0, image.width(), image.height())))
+            pixmap = QPixmap.fromImage(image)
+            self._bytes += self._nbytes(pixmap)
+            while self._tiles and self._bytes > self.budget:
+                _, old = self._tiles.popitem(last=False)
+                self._bytes -= self._nbytes(old)
+        self._tiles[key] = pixmap
+        return pixmap
+
+    def draw(self, painter, rect, scale):
+        """Draw the tiles intersecting `rect', in image coordinates, at the
+        level matching `scale'."""
+        n = self.levelFor(scale)
+        image = self.level(n)
+        fx = float(self.width()) / image.width()
+        fy = float(self.height()) / image.height()
+        t = self.tileSize
+        tx0 = max(0, int(floor(rect.left() / fx / t)))
+        ty0 = max(0, int(floor(rect.top() / fy / t)))
+        tx1 = min(int(ceil(float(image.width()) / t)),
+                  int(floor(rect.right() / fx / t)) + 1)
+        ty1 = min(int(ceil(float(image.height()) / t)),
+                  int(floor(rect.bottom() / fy / t)) + 1)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                pixmap = self.tile(n, tx, ty)
+                target = QRectF(tx * t * fx, ty * t * fy,
+                                pixmap.width() * fx, pixmap.height() * fy)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+    @staticmethod
+    def _nbytes(pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
@@ -1,35 +1,53 @@
+from __future__ import print_function
+
 import base64
+import functools
 try:
     import io
 except ImportError:
     import io as io
+import glob
+import multiprocessing
+import os
+import os.path as osp
+import sys
+import time
+import traceback
 import warnings
 
-import matplotlib.pyplot as plt
 import numpy as np
-import PIL.Image
-import PIL.ImageDraw
-import scipy.misc
+
+from labelme.binaryLabelFile import BinaryLabelFile
+from labelme.labelFile import LabelFile, NotLabelFileError, scanLabelFile
+
+# PIL is imported within the functions using it, to keep importing this
+# module, and so the labelme package, fast.
+
+
+# N -> colormap, see label_colormap.
+_label_colormaps = {}
 
 
 def label_colormap(N=256):
+    """PASCAL VOC style colormap, as an (N, 3) float32 array in [0, 1]."""
+    return _label_colormap(N).copy()
+
 
-    def bitget(byteval, idx):
-        return ((byteval & (1 << idx)) != 0)
-
-    cmap = np.zeros((N, 3))
-    for i in range(0, N):
-        id = i
-        r, g, b = 0, 0, 0
-        for j in range(0, 8):
-            r = np.bitwise_or(r, (bitget(id, 0) << 7-j))
-            g = np.bitwise_or(g, (bitget(id, 1) << 7-j))
-            b = np.bitwise_or(b, (bitget(id, 2) << 7-j))
-            id = (id >> 3)
-        cmap[i, 0] = r
-        cmap[i, 1] = g
-        cmap[i, 2] = b
+def _label_colormap(N):
+    # Cached by N and read-only, as it is shared; label_colormap returns a
+    # copy that callers may modify.
+    cmap = _label_colormaps.get(N)
+    if cmap is not None:
+        return cmap
+
+    ids = np.arange(N)
+    cmap = np.zeros((N, 3), dtype=np.int64)
+    for j in range(8):
+        for c in range(3):
+            cmap[:, c] |= ((ids >> (3 * j + c)) & 1) << (7 - j)
     cmap = cmap.astype(np.float32) / 255
+    cmap.flags.writeable = False
+    _label_colormaps[N] = cmap
     return cmap
 
 
@@ -41,33 +59,111 @@ def labelcolormap(N=256):
 # similar function as skimage.color.label2rgb
 def label2rgb(lbl, img=None, n_labels=None, alpha=0.3, thresh_suppress=0):
     if n_labels is None:
-        n_labels = len(np.unique(lbl))
+        n_labels = max(int(lbl.max()) + 1, 1) if lbl.size else 1
 
-    cmap = label_colormap(n_labels)
-    cmap = (cmap * 255).astype(np.uint8)
+    cmap = _label_colormap_uint8(n_labels)
 
     lbl_viz = cmap[lbl]
     lbl_viz[lbl == -1] = (0, 0, 0)  # unlabeled
 
     if img is not None:
-        img_gray = PIL.Image.fromarray(img).convert('LA')
-        img_gray = np.asarray(img_gray.convert('RGB'))
-        # img_gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        # img_gray = cv2.cvtColor(img_gray, cv2.COLOR_GRAY2RGB)
-        lbl_viz = alpha * lbl_viz + (1 - alpha) * img_gray
-        lbl_viz = lbl_viz.astype(np.uint8)
+        import PIL.Image
+        img_gray = np.asarray(PIL.Image.fromarray(img).convert('L'))
+        # Blend in 8-bit fixed point: v * a + g * (1 - a) with a = k / 256.
+        k = int(round(alpha * 256))
+        out = np.empty(lbl_viz.shape, dtype=np.uint16)
+        np.multiply(lbl_viz, np.uint16(k), out=out)
+        out += (img_gray.astype(np.uint16) * (256 - k))[..., None]
+        out >>= 8
+        lbl_viz = out.astype(np.uint8)
 
     return lbl_viz
 
 
-def img_b64_to_array(img_b64):
-    f = io.BytesIO()
-    f.write(base64.b64decode(img_b64))
-    img_arr = np.array(PIL.Image.open(f))
-    return img_arr
+def _label_colormap_uint8(N):
+    key = ('uint8', N)
+    cmap = _label_colormaps.get(key)
+    if cmap is None:
+        cmap = (_label_colormap(N) * 255).astype(np.uint8)
+        cmap.flags.writeable = False
+        _label_colormaps[key] = cmap
+    return cmap
+
+
+def img_data_to_array(img_data, draft=None):
+    """Decode the data of an image file into an array.
+
+    The data is decoded in place, without copying it into a buffer first.
+    With `draft', a (width, height), JPEG images are decoded at the
+    smallest of 1/2, 1/4 or 1/8 scale that is at least that size, which is
+    much faster for thumbnails.
+    """
+    import PIL.Image
+    img = PIL.Image.open(io.BytesIO(img_data))
+    if draft is not None:
+        img.draft(img.mode, draft)
+    return np.array(img)
+
+
+def img_b64_to_array(img_b64, draft=None):
+    return img_data_to_array(base64.b64decode(img_b64), draft=draft)
+
+
+def load_label_file(filename):
+    """Read a JSON or binary label file without decoding its image.
+
+    Returns the document, with `imageData' set to None, and a function
+    returning the image file data, either embedded or referenced. Raises
+    NotLabelFileError for JSON files that are not label files.
+    """
+    if BinaryLabelFile.isLabelFile(filename):
+        label_file = BinaryLabelFile(filename, lazy=True)
+        data = dict(label_file.header, imageData=None)
+        offsets, points = label_file.offsets, label_file.points
+        data['shapes'] = [
+            dict(s, points=points[offsets[i]:offsets[i + 1]].tolist())
+            for i, s in enumerate(label_file.header['shapes'])]
+        return data, lambda: label_file.imageData
+    data, span = scanLabelFile(filename)
+    if not isinstance(data, dict) or 'shapes' not in data or \
+            'imagePath' not in data:
+        raise NotLabelFileError('%s is not a label file' % filename)
+    if span is not None:
+        return data, lambda: LabelFile.readImageData(filename, *span)
+    img_file = LabelFile.resolveImagePath(filename, data['imagePath'])
+    return data, lambda: LabelFile.readImageFile(img_file,
+                                                 data.get('imageHash'))
+
+
+def polygons_to_mask_roi(img_shape, polygons):
+    """Rasterise a polygon within its bounding box, clipped to the image.
+
+    Returns the boolean mask of the box and the position (x0, y0) of its
+    top left corner in the image. PIL does not rasterise a shifted polygon
+    exactly the same, so the mask can differ from that of polygons_to_mask
+    by a pixel on the boundary.
+    """
+    import PIL.Image
+    import PIL.ImageDraw
+    height, width = img_shape[:2]
+    xy = np.asarray(polygons, dtype=np.float64).reshape(-1, 2)
+    if not len(xy):
+        return np.zeros((0, 0), dtype=bool), 0, 0
+    x0 = min(max(int(np.floor(xy[:, 0].min())), 0), width)
+    y0 = min(max(int(np.floor(xy[:, 1].min())), 0), height)
+    x1 = min(max(int(np.ceil(xy[:, 0].max())) + 1, x0), width)
+    y1 = min(max(int(np.ceil(xy[:, 1].max())) + 1, y0), height)
+    mask = PIL.Image.new('L', (x1 - x0, y1 - y0), 0)
+    if x1 > x0 and y1 > y0:
+        xy = list(map(tuple, xy - (x0, y0)))
+        PIL.ImageDraw.Draw(mask).polygon(xy=xy, outline=1, fill=1)
+    mask = np.array(mask, dtype=bool)
+    return mask, x0, y0
 
 
 def polygons_to_mask(img_shape, polygons):
+    import PIL.Image
+    import PIL.ImageDraw
     mask = np.zeros(img_shape[:2], dtype=np.uint8)
     mask = PIL.Image.fromarray(mask)
     xy = list(map(tuple, polygons))
@@ -76,55 +172,334 @@ def polygons_to_mask(img_shape, polygons):
     return mask
 
 
-def draw_label(label, img, label_names, colormap=None):
-    plt.subplots_adjust(left=0, right=1, top=1, bottom=0,
-                        wspace=0, hspace=0)
-    plt.margins(0, 0)
-    plt.gca().xaxis.set_major_locator(plt.NullLocator())
-    plt.gca().yaxis.set_major_locator(plt.NullLocator())
+def polygons_to_rle(img_shape, polygons, compress=False):
+    """Run-length encode a polygon, in the COCO format, without making its
+    dense mask.
+
+    The polygon is scanned column by column, as COCO runs go down the
+    columns: pixel (x, y) is covered when the point (x, y) lies inside
+    the polygon (even-odd rule). Boundary pixels may therefore differ
+    from polygons_to_mask, which also draws the outline.
+    """
+    height, width = img_shape[:2]
+    xy = np.asarray(polygons, dtype=np.float64).reshape(-1, 2)
+    p1, p2 = xy, np.roll(xy, -1, axis=0)
+    p1, p2 = p1[p1[:, 0] != p2[:, 0]], p2[p1[:, 0] != p2[:, 0]]
+    if not len(p1):
+        return _rle(height, width, [height * width], compress)
+    lo = np.minimum(p1[:, 0], p2[:, 0])
+    hi = np.maximum(p1[:, 0], p2[:, 0])
+    x0 = max(int(np.ceil(lo.min())), 0)
+    x1 = min(int(np.ceil(hi.max())), width)
+    xs = np.arange(x0, x1)
+    # Crossings of every column with the edges spanning it; the
+    # half-open span counts a vertex shared by two edges once.
+    col, edge = np.nonzero((xs[:, None] >= lo) & (xs[:, None] < hi))
+    x = xs[col]
+    # Multiplying first keeps crossings at integer coordinates exact.
+    y = p1[edge, 1] + (x - p1[edge, 0]) * (p2[edge, 1] - p1[edge, 1]) /\
+        (p2[edge, 0] - p1[edge, 0])
+    order = np.lexsort((y, x))
+    x, y = x[order], y[order]
+    # Consecutive crossings of a column pair up into spans inside.
+    y = np.clip(np.ceil(y), 0, height).astype(np.int64)
+    starts = x[0::2] * height + y[0::2]
+    ends = x[1::2] * height + y[1::2]
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    return _rle(height, width, _runs_to_counts(starts, ends, height * width),
+                compress)
+
+
+def _runs_to_counts(starts, ends, size):
+    """Counts of alternate background and foreground runs, given the
+    sorted [start, end) runs of foreground."""
+    if len(starts):
+        # Join runs that touch, e.g. down a column into the next one.
+        gaps = starts[1:] > ends[:-1]
+        starts = starts[np.concatenate([[True], gaps])]
+        ends = ends[np.concatenate([gaps, [True]])]
+    bounds = np.empty(2 * len(starts) + 2, dtype=np.int64)
+    bounds[0] = 0
+    bounds[1:-1:2] = starts
+    bounds[2:-1:2] = ends
+    bounds[-1] = size
+    counts = np.diff(bounds)
+    if len(counts) > 1 and counts[-1] == 0:
+        counts = counts[:-1]
+    return counts
+
+
+def _rle(height, width, counts, compress):
+    counts = [int(c) for c in counts]
+    if compress:
+        counts = rle_counts_to_string(counts)
+    return {'size': [height, width], 'counts': counts}
+
+
+def rle_encode(mask, compress=False):
+    """Run-length encode a boolean mask in the COCO format."""
+    height, width = mask.shape[:2]
+    flat = np.asarray(mask, dtype=bool).ravel(order='F')
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate([[0], change, [flat.size]])
+    counts = np.diff(bounds)
+    if flat.size and flat[0]:
+        counts = np.concatenate([[0], counts])
+    return _rle(height, width, counts, compress)
+
+
+def _rle_counts(rle):
+    counts = rle['counts']
+    if not isinstance(counts, list):
+        counts = rle_counts_from_string(counts)
+    return np.asarray(counts, dtype=np.int64)
 
+
+def rle_decode(rle):
+    height, width = rle['size']
+    counts = _rle_counts(rle)
+    values = np.arange(len(counts)) % 2 == 1
+    mask = np.repeat(values, counts)
+    return mask.reshape((height, width), order='F')
+
+
+def rle_area(rle):
+    return int(_rle_counts(rle)[1::2].sum())
+
+
+def rle_to_bbox(rle):
+    """Bounding box [x, y, width, height] of the mask."""
+    height, width = rle['size']
+    counts = _rle_counts(rle)
+    bounds = np.cumsum(np.concatenate([[0], counts]))
+    starts, ends = bounds[1:-1:2], bounds[2::2] - 1
+    starts, ends = starts[ends >= starts], ends[ends >= starts]
+    if not len(starts):
+        return [0, 0, 0, 0]
+    xs, xe = starts // height, ends // height
+    ys = np.where(xs == xe, starts % height, 0)
+    ye = np.where(xs == xe, ends % height, height - 1)
+    x0, y0 = int(xs.min()), int(ys.min())
+    return [x0, y0, int(xe.max()) - x0 + 1, int(ye.max()) - y0 + 1]
+
+
+def rle_counts_to_string(counts):
+    """Compress RLE counts into the string form of the COCO API: each
+    count, minus the one two runs back, as 5-bit groups in ASCII."""
+    chars = []
+    for i, x in enumerate(counts):
+        if i > 2:
+            x -= counts[i - 2]
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = x != -1 if c & 0x10 else x != 0
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return ''.join(chars)
+
+
+def rle_counts_from_string(s):
+    counts = []
+    p = 0
+    while p < len(s):
+        x = 0
+        k = 0
+        more = True
+        while more:
+            c = ord(s[p]) - 48
+            x |= (c & 0x1f) << (5 * k)
+            more = c & 0x20
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+def draw_label(label, img, label_names, colormap=None):
+    """Blend the label image over img and draw a legend of label_names in
+    the lower right corner, at the resolution of img."""
+    import PIL.Image
+    import PIL.ImageDraw
+    import PIL.ImageFont
     if colormap is None:
-        colormap = label_colormap(len(label_names))
+        colormap = _label_colormap(len(label_names))
+    colors = (np.asarray(colormap) * 255).astype(np.uint8)
 
     label_viz = label2rgb(label, img, n_labels=len(label_names))
-    plt.imshow(label_viz)
-    plt.axis('off')
 
-    plt_handlers = []
-    plt_titles = []
-    for label_value, label_name in enumerate(label_names):
-        fc = colormap[label_value]
-        p = plt.Rectangle((0, 0), 1, 1, fc=fc)
-        plt_handlers.append(p)
-        plt_titles.append(label_name)
-    plt.legend(plt_handlers, plt_titles, loc='lower right', framealpha=.5)
+    font = PIL.ImageFont.load_default()
+    sizes = [_text_size(font, name) for name in label_names]
+    pad = 4
+    line_height = max([h for _, h in sizes] + [10])
+    height, width = label_viz.shape[:2]
+    box_w = 3 * pad + line_height + max([w for w, _ in sizes] + [0])
+    box_h = pad + len(label_names) * (line_height + pad)
+    x0 = max(0, width - box_w - pad)
+    y0 = max(0, height - box_h - pad)
+
+    # Half transparent white box, like the legend of matplotlib.
+    box = label_viz[y0:y0 + box_h, x0:x0 + box_w].astype(np.uint16)
+    label_viz[y0:y0 + box_h, x0:x0 + box_w] = (box + 255) // 2
+
+    out = PIL.Image.fromarray(label_viz)
+    draw = PIL.ImageDraw.Draw(out)
+    draw.rectangle([x0, y0, x0 + box_w - 1, y0 + box_h - 1],
+                   outline=(204, 204, 204))
+    for i, label_name in enumerate(label_names):
+        y = y0 + pad + i * (line_height + pad)
+        draw.rectangle([x0 + pad, y, x0 + pad + line_height - 1,
+                        y + line_height - 1],
+                       fill=tuple(colors[i % len(colors)]))
+        draw.text((x0 + 2 * pad + line_height, y), label_name,
+                  fill=(0, 0, 0), font=font)
+    return np.asarray(out)
+
 
-    f = io.BytesIO()
-    plt.savefig(f, bbox_inches='tight', pad_inches=0)
-    plt.cla()
-    plt.close()
+def _text_size(font, text):
+    if hasattr(font, 'getbbox'):
+        left, top, right, bottom = font.getbbox(text)
+        return right, bottom
+    return font.getsize(text)
 
-    out = np.array(PIL.Image.open(f))[:, :, :3]
-    out = scipy.misc.imresize(out, img.shape[:2])
-    return out
+
+def shapes_to_label(img_shape, shapes, label_name_to_val, instance=False):
+    """Rasterise the shapes into a class map, painting each polygon with
+    the value of its label in the given order, so later shapes cover
+    earlier ones. The map is an int32 array, drawn at the smallest pixel
+    depth holding the values.
+
+    With instance, also return an instance map in which the i-th shape is
+    painted with i + 1, from the same pass over the shapes.
+    """
+    import PIL.Image
+    import PIL.ImageDraw
+    size = (img_shape[1], img_shape[0])
+    max_val = max(list(label_name_to_val.values()) + [0])
+    cls = PIL.Image.new('L' if max_val <= 255 else 'I', size, 0)
+    draw_cls = PIL.ImageDraw.Draw(cls)
+    if instance:
+        ins = PIL.Image.new('L' if len(shapes) <= 255 else 'I', size, 0)
+        draw_ins = PIL.ImageDraw.Draw(ins)
+    for i, shape in enumerate(shapes):
+        xy = list(map(tuple, shape['points']))
+        label_value = label_name_to_val[shape['label']]
+        draw_cls.polygon(xy=xy, outline=label_value, fill=label_value)
+        if instance:
+            draw_ins.polygon(xy=xy, outline=i + 1, fill=i + 1)
+    cls = np.array(cls, dtype=np.int32)
+    if instance:
+        return cls, np.array(ins, dtype=np.int32)
+    return cls
 
 
 def labelme_shapes_to_label(img_shape, shapes):
     label_name_to_val = {'background': 0}
-    lbl = np.zeros(img_shape[:2], dtype=np.int32)
-    for shape in sorted(shapes, key=lambda x: x['label']):
-        polygons = shape['points']
+    shapes = sorted(shapes, key=lambda x: x['label'])
+    for shape in shapes:
         label_name = shape['label']
-        if label_name in label_name_to_val:
-            label_value = label_name_to_val[label_name]
-        else:
-            label_value = len(label_name_to_val)
-            label_name_to_val[label_name] = label_value
-        mask = polygons_to_mask(img_shape[:2], polygons)
-        lbl[mask] = label_value
+        if label_name not in label_name_to_val:
+            label_name_to_val[label_name] = len(label_name_to_val)
+    lbl = shapes_to_label(img_shape, shapes, label_name_to_val)
 
     lbl_names = [None] * (max(label_name_to_val.values()) + 1)
     for label_name, label_value in label_name_to_val.items():
         lbl_names[label_value] = label_name
 
     return lbl, lbl_names
+
+
+def find_label_files(paths, suffixes=('.json', '.lbl'), exclude=()):
+    """Expand label files, directories (searched recursively for files
+    with the given suffixes) and glob patterns into a list of files,
+    leaving out those in `exclude', such as the output of a conversion."""
+    exclude = set(osp.realpath(path) for path in exclude)
+    label_files = []
+    for path in paths:
+        if osp.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                label_files.extend(
+                    osp.join(root, f) for f in sorted(files)
+                    if osp.splitext(f)[1].lower() in suffixes)
+        elif osp.exists(path):
+            label_files.append(path)
+        else:
+            label_files.extend(sorted(glob.glob(path)))
+    return [f for f in label_files if osp.realpath(f) not in exclude]
+
+
+def _convert_safe(convert, args):
+    try:
+        return args[0], 'converted', convert(*args)
+    except NotLabelFileError as e:
+        return args[0], 'skipped', str(e)
+    except Exception:
+        return args[0], 'failed', traceback.format_exc()
+
+
+class LabelFileConverter(object):
+    """Convert label files in worker processes, for the scripts.
+
+    `convert' is a module level function, taking a label file and further
+    arguments. Files it fails on are reported, and files that are not
+    label files are skipped, without stopping the others.
+    """
+
+    def __init__(self, convert, jobs=1, ordered=False, chunksize=4):
+        self.convert = convert
+        self.jobs = jobs
+        self.ordered = ordered
+        self.chunksize = chunksize
+        self.counts = dict(converted=0, skipped=0, failed=0)
+        self.failures = []
+        self.t_start = time.time()
+
+    def run(self, tasks, every=1):
+        """Yield the (label file, result) of each of `tasks', tuples of
+        arguments to `convert', printing the progress every `every'
+        files. Results are in the order of `tasks' if `ordered'."""
+        convert_safe = functools.partial(_convert_safe, self.convert)
+        if self.jobs > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(self.jobs)
+            imap = pool.imap if self.ordered else pool.imap_unordered
+            results = imap(convert_safe, tasks, chunksize=self.chunksize)
+        else:
+            pool = None
+            results = (convert_safe(task) for task in tasks)
+        self.t_start = time.time()
+        for i, (label_file, status, detail) in enumerate(results):
+            self.counts[status] += 1
+            if status == 'converted':
+                yield label_file, detail
+            elif status == 'skipped':
+                print('skipped %s' % detail)
+            else:
+                self.failures.append((label_file, detail))
+            if (i + 1) % every == 0 or i + 1 == len(tasks):
+                elapsed = time.time() - self.t_start
+                print('[%d/%d %.1f files/s] converted: %d, failed: %d' %
+                      (i + 1, len(tasks), (i + 1) / max(elapsed, 1e-6),
+                       self.counts['converted'], self.counts['failed']))
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def summarize(self):
+        """Print how many files were converted, and why those that failed
+        did, to stderr. Returns whether none failed."""
+        print('converted: %d, skipped: %d, failed: %d in %.1fs' %
+              (self.counts['converted'], self.counts['skipped'],
+               self.counts['failed'], time.time() - self.t_start))
+        for label_file, detail in self.failures:
+            # The last line of the traceback is the error itself.
+            print('%s: %s' % (label_file, detail.strip().splitlines()[-1]),
+                  file=sys.stderr)
+        return not self.failures
@@ -66,7 +66,6 @@ setup(
     install_requires=[
         'matplotlib',
         'Pillow>=2.8.0',
-        'scipy',
         'PyYAML',
     ],
     license='GPLv3',
@@ -82,6 +81,7 @@ setup(
     entry_points={'console_scripts': ['labelme=labelme.app:main']},
     scripts=[
         'scripts/labelme_draw_json',
+        'scripts/labelme_json_to_coco',
         'scripts/labelme_json_to_dataset',
         'scripts/labelme_on_docker',
     ],
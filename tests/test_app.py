@@ -0,0 +1,56 @@
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import nose
+
+try:
+    from PyQt5.QtGui import QImage
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    from PyQt4.QtGui import QApplication, QImage
+
+from labelme.imageLoader import loadImageFile
+
+
+here = osp.dirname(osp.abspath(__file__))
+
+
+def test_load_out_of_order():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication.instance() or QApplication([])  # NOQA
+    from labelme.app import MainWindow
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        img_file1 = osp.join(tmp_dir, 'a.jpg')
+        shutil.copy(osp.join(here, '../static/apc2016_obj3.jpg'), img_file1)
+        img_file2 = osp.join(tmp_dir, 'b.png')
+        image = QImage(300, 200, QImage.Format_RGB32)
+        image.fill(0)
+        image.save(img_file2)
+
+        win = MainWindow(prefetch=0)
+        for can, img_file in enumerate([img_file1, img_file2]):
+            win.loadFile(can, img_file)
+            win.imageLoaded(can, win.loadToken[can], loadImageFile(img_file))
+        # the pair is opened again, and the canvases are reset
+        win.loadFile(0, img_file1)
+        win.loadFile(1, img_file2)
+        # the second canvas is shown while the first is still empty
+        win.imageLoaded(1, win.loadToken[1], loadImageFile(img_file2))
+        nose.tools.assert_is_none(win.loading[1])
+        nose.tools.assert_equal(win.filename[1], img_file2)
+        # the zoom fits the image shown
+        nose.tools.assert_equal(win.fitSize(), image.size())
+        nose.tools.assert_equal(win.zoomWidget.value(),
+                                int(100 * win.scaleFitWindow()))
+        win.imageLoaded(0, win.loadToken[0], loadImageFile(img_file1))
+        nose.tools.assert_equal(win.loading, [None, None])
+        nose.tools.assert_equal(win.filename, [img_file1, img_file2])
+        win.loadPool.waitForDone()
+        win.dirty = False
+        win.deleteLater()
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,115 @@
+import os
+
+import nose
+
+try:
+    from PyQt5.QtCore import QPointF, QRect
+    from PyQt5.QtGui import QColor, QImage, QPainter, QPixmap
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    from PyQt4.QtCore import QPointF, QRect
+    from PyQt4.QtGui import QApplication, QColor, QImage, QPainter, QPixmap
+
+from labelme.shape import Shape
+
+
+def _app():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return QApplication.instance() or QApplication([])
+
+
+def _shape(points):
+    shape = Shape(label='a')
+    for x, y in points:
+        shape.addPoint(QPointF(x, y))
+    shape.addPoint(QPointF(*points[0]))
+    return shape
+
+
+def test_widget_rect():
+    app = _app()  # NOQA
+    from labelme.canvas import Canvas
+
+    canvas = Canvas(0)
+    canvas.loadPixmap(QPixmap(200, 100))
+    shape = _shape([(20, 30), (60, 30), (40, 70)])
+    shape.selected = shape.fill = True
+    shape.highlightVertex(0, Shape.NEAR_VERTEX)
+    for width, height in [(200, 100), (500, 400)]:
+        canvas.resize(width, height)
+        for scale in [0.25, 1.0, 3.0]:
+            canvas.scale = scale
+            rect = canvas.widgetRect(shape.boundingRect())
+            # everything painted for the shape lies within its rect
+            image = QImage(canvas.size(), QImage.Format_ARGB32)
+            image.fill(0)
+            p = QPainter(image)
+            p.setRenderHint(QPainter.Antialiasing)
+            p.scale(scale, scale)
+            p.translate(canvas.offsetToCenter())
+            Shape.scale = scale
+            shape.paint(p)
+            p.end()
+            painted = QRect()
+            for y in range(image.height()):
+                for x in range(image.width()):
+                    if image.pixel(x, y) >> 24:
+                        painted |= QRect(x, y, 1, 1)
+            nose.tools.assert_false(painted.isEmpty())
+            nose.tools.assert_true(rect.contains(painted),
+                                   (scale, width, rect, painted))
+    Shape.scale = 1.0
+
+
+def test_static_layer():
+    app = _app()  # NOQA
+    from labelme.canvas import Canvas
+
+    canvas = Canvas(0)
+    canvas.loadPixmap(QPixmap(200, 100))
+    a = _shape([(20, 30), (60, 30), (40, 70)])
+    b = _shape([(120, 30), (160, 30), (140, 70)])
+    canvas.loadShapes([a, b])
+    canvas.resize(200, 100)
+    canvas.show()
+    nose.tools.assert_is_none(canvas.staticLayer())
+    canvas.beginInteraction(a)
+    layer = canvas.staticLayer()
+    nose.tools.assert_is_not_none(layer)
+    nose.tools.assert_is(canvas.staticLayer(), layer)
+    nose.tools.assert_equal(layer.size(),
+                            canvas.size() * canvas.devicePixelRatioF())
+
+    def changed():
+        new = canvas.staticLayer()
+        result = new is not layer
+        return result, new
+
+    canvas.scale = 2.0
+    rebuilt, layer = changed()
+    nose.tools.assert_true(rebuilt)
+    canvas.resize(150, 100)
+    rebuilt, layer = changed()
+    nose.tools.assert_true(rebuilt)
+    canvas.hideBackround = True
+    canvas.setHiding(True)
+    rebuilt, layer = changed()
+    nose.tools.assert_true(rebuilt)
+    line_color = Shape.line_color
+    try:
+        Shape.line_color = QColor(1, 2, 3)
+        rebuilt, layer = changed()
+        nose.tools.assert_true(rebuilt)
+    finally:
+        Shape.line_color = line_color
+    rebuilt, layer = changed()
+    nose.tools.assert_true(rebuilt)
+    # the active shape is not pre-rendered, the others are
+    canvas.updateShapes(a)
+    nose.tools.assert_is(canvas.staticLayer(), layer)
+    canvas.updateShapes(b)
+    rebuilt, layer = changed()
+    nose.tools.assert_true(rebuilt)
+    canvas.endInteraction()
+    nose.tools.assert_is_none(canvas.staticLayer())
+    canvas.hide()
@@ -0,0 +1,123 @@
+import os
+import random
+
+import nose
+
+try:
+    from PyQt5.QtCore import QPointF
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    from PyQt4.QtCore import QPointF
+    from PyQt4.QtGui import QApplication
+
+from labelme.edgeGraph import EdgeGraph
+from labelme.shape import Shape
+
+
+def _shape(points, closed=True):
+    shape = Shape(label='a')
+    for x, y in points:
+        shape.addPoint(QPointF(x, y))
+    if closed:
+        shape.addPoint(QPointF(*points[0]))
+    return shape
+
+
+def test_owners():
+    a = _shape([(0, 0), (10, 0), (10, 10), (0, 10)])
+    b = _shape([(10, 0), (20, 0), (20, 10), (10, 10)])
+    c = _shape([(10, 0), (10, 10), (30, 30)], closed=False)
+    graph = EdgeGraph()
+    graph.sync([a, b, c])
+    # the edge shared by the closed shapes, in either direction
+    shared = [(a, 1), (b, 3)]
+    nose.tools.assert_equal(
+        sorted(graph.owners(QPointF(10, 0), QPointF(10, 10)),
+               key=lambda o: o[0] is b), shared)
+    nose.tools.assert_equal(
+        sorted(graph.owners(QPointF(10, 10), QPointF(10, 0)),
+               key=lambda o: o[0] is b), shared)
+    # open shapes are left out
+    nose.tools.assert_equal(graph.owners(QPointF(10, 10), QPointF(30, 30)),
+                            [])
+    nose.tools.assert_equal(graph.junctions[20, 10], 1)
+    nose.tools.assert_equal(graph.junctions[10, 10], 2)
+
+    b.moveBy(QPointF(5, 0))
+    graph.sync([a, b, c])
+    nose.tools.assert_equal(graph.owners(QPointF(10, 0), QPointF(10, 10)),
+                            [(a, 1)])
+    graph.sync([b])
+    nose.tools.assert_equal(graph.owners(QPointF(10, 0), QPointF(10, 10)),
+                            [])
+    nose.tools.assert_not_in((0, 10), graph.junctions)
+
+
+def test_find_edge_by_points():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication.instance() or QApplication([])  # NOQA
+    from labelme.canvas import Canvas
+
+    a = _shape([(0, 0), (10, 0), (10, 10), (0, 10)])
+    b = _shape([(10, 0), (20, 0), (20, 10), (10, 10)])
+    c = _shape([(10, 10), (10, 0), (5, 5)])
+    canvas = Canvas(0)
+    canvas.loadShapes([a, b, c])
+    canvas.updateEdgeGraph()
+    p1, p2 = QPointF(10, 0), QPointF(10, 10)
+    # the top-most shape wins
+    nose.tools.assert_equal(canvas.findEdgeByPoints(p1, p2), (c, 0))
+    canvas.visible[c] = False
+    nose.tools.assert_equal(canvas.findEdgeByPoints(p1, p2), (b, 3))
+    nose.tools.assert_equal(canvas.findEdgeByPoints(p1, QPointF(5, 5)),
+                            (None, None))
+
+
+def _segment_distance(x, y, key):
+    (x1, y1), (x2, y2) = key
+    dx, dy = x2 - x1, y2 - y1
+    t = max(0, min(1, ((x - x1) * dx + (y - y1) * dy) / (dx * dx + dy * dy)))
+    return ((x - x1 - t * dx) ** 2 + (y - y1 - t * dy) ** 2) ** 0.5
+
+
+def test_pick():
+    rand = random.Random(0)
+    shapes = []
+    for _ in range(100):
+        x, y = rand.uniform(0, 1000), rand.uniform(0, 1000)
+        shapes.append(_shape([
+            (x, y), (x + rand.uniform(-300, 300), y + rand.uniform(-20, 20)),
+            (x + rand.uniform(-20, 20), y + rand.uniform(-300, 300))]))
+    # ties: two parallel edges at the same distance of x = 2000
+    shapes.append(_shape([(1990, 0), (1990, 100), (1980, 50)]))
+    shapes.append(_shape([(2010, 0), (2010, 100), (2020, 50)]))
+    graph = EdgeGraph()
+    graph.sync(shapes)
+    tolerance = 2.0
+    points = [(rand.uniform(0, 1000), rand.uniform(0, 1000))
+              for _ in range(500)]
+    points += [(2000, 50), (1987.9, 50), (1988.1, 50)]
+    # points just outside and inside the tolerance of an edge
+    for key in list(graph.edges)[:50]:
+        (x1, y1), (x2, y2) = key
+        dx, dy = x2 - x1, y2 - y1
+        norm = (dx * dx + dy * dy) ** 0.5
+        for offset in [tolerance - 1e-6, tolerance + 1e-6]:
+            points.append(((x1 + x2) / 2 - dy / norm * offset,
+                           (y1 + y2) / 2 + dx / norm * offset))
+    for x, y in points:
+        # a linear scan over all the edges
+        dist, best = min((_segment_distance(x, y, key), key)
+                         for key in graph.edges)
+        picked = graph.pick(x, y, tolerance)
+        if dist > tolerance:
+            nose.tools.assert_is_none(picked)
+        else:
+            nose.tools.assert_is_not_none(picked)
+            nose.tools.assert_almost_equal(
+                _segment_distance(x, y, picked), dist)
+    # with ties, either edge will do
+    nose.tools.assert_is_none(graph.pick(2000, 50, tolerance))
+    nose.tools.assert_in(graph.pick(2000, 50, 10),
+                         [((1990, 0), (1990, 100)),
+                          ((2010, 0), (2010, 100))])
@@ -0,0 +1,55 @@
+import os.path as osp
+import shutil
+import tempfile
+
+import nose
+
+from labelme.editJournal import EditJournal
+from labelme.shape import Shape
+
+try:
+    from PyQt5.QtCore import QPointF
+except ImportError:
+    from PyQt4.QtCore import QPointF
+
+
+def _shape(label, points, id):
+    shape = Shape(label=label, id=id)
+    for x, y in points:
+        shape.addPoint(QPointF(x, y))
+    shape.close()
+    return shape
+
+
+def test_record_and_replay():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        base = [('a', [(0, 0), (10, 0), (10, 10)], None, None, 1),
+                ('b', [(0, 0), (5, 0), (5, 5)], None, None, 2)]
+        shapes = [_shape(*s[:2] + s[4:]) for s in base]
+        journal = EditJournal.forLabelFile(osp.join(tmp_dir, 'a.json'))
+        journal.sync(shapes)
+        nose.tools.assert_equal(journal.record(shapes), 0)
+
+        shapes[0].moveVertexBy(1, QPointF(1, 1))
+        shapes[0].label = 'c'
+        shapes[0].correspondence['x'] = 2
+        shapes.pop(1)
+        shapes.append(_shape('d', [(1, 1), (2, 2), (3, 1)], 3))
+        nose.tools.assert_equal(journal.record(shapes), 5)
+        mark = journal.mark()
+        shapes[0].correspondence.pop('x')
+        journal.record(shapes)
+
+        result, crspdc = EditJournal.replay(base, journal.read())
+        nose.tools.assert_equal(
+            [(s[0], s[1], s[4]) for s in result],
+            [('c', [[0, 0], [11, 1], [10, 10]], 1),
+             ('d', [[1, 1], [2, 2], [3, 1]], 3)])
+        nose.tools.assert_equal(crspdc, [(1, 'x', 2), (1, 'x', None)])
+
+        journal.compact(mark)
+        nose.tools.assert_equal([op['op'] for op in journal.read()],
+                                ['crspdc_remove'])
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,132 @@
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import nose
+
+try:
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    from PyQt4.QtGui import QApplication
+
+from labelme.imageLoader import ImageCache
+from labelme.imageLoader import ImageLoadError
+from labelme.imageLoader import imageFiles
+from labelme.imageLoader import loadImageFile
+from labelme.imageLoader import Prefetcher
+from labelme.labelFile import LabelFile
+
+
+here = osp.dirname(osp.abspath(__file__))
+
+
+def test_load_image_file():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        img_file = osp.join(tmp_dir, 'a.jpg')
+        shutil.copy(osp.join(here, '../static/apc2016_obj3.jpg'), img_file)
+        loaded = loadImageFile(img_file)
+        nose.tools.assert_equal(loaded.filename, img_file)
+        nose.tools.assert_is_none(loaded.labelFile)
+        nose.tools.assert_equal(loaded.image.width(), 1210)
+        nose.tools.assert_equal(loaded.shapes, [])
+        nose.tools.assert_true(loaded.isCurrent())
+
+        # a label file next to the image is loaded instead
+        shapes = [dict(label='a', points=[(0, 0), (10, 0), (10, 10)],
+                       line_color=None, fill_color=None, shape_id=0)]
+        label_file = osp.join(tmp_dir, 'a.json')
+        LabelFile().save(label_file, shapes, img_file, loaded.imageData,
+                         storeData=False)
+        nose.tools.assert_false(loaded.isCurrent())
+        loaded = loadImageFile(img_file)
+        nose.tools.assert_equal(loaded.filename, label_file)
+        nose.tools.assert_equal(len(loaded.shapes), 1)
+        nose.tools.assert_equal(loaded.image.height(), 907)
+
+        with open(osp.join(tmp_dir, 'b.png'), 'wb') as f:
+            f.write(b'not an image')
+        nose.tools.assert_raises(ImageLoadError, loadImageFile,
+                                 osp.join(tmp_dir, 'b.png'))
+        open(osp.join(tmp_dir, 'c.lbl'), 'wb').close()
+        nose.tools.assert_equal(
+            [osp.basename(f) for f in imageFiles(tmp_dir)],
+            ['a.jpg', 'b.png', 'c.lbl'])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_image_cache():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        img_files = []
+        for name in ['a.jpg', 'b.jpg', 'c.jpg']:
+            img_files.append(osp.join(tmp_dir, name))
+            shutil.copy(osp.join(here, '../static/apc2016_obj3.jpg'),
+                        img_files[-1])
+        cache = ImageCache()
+        loaded = loadImageFile(img_files[0], cache=cache)
+        nose.tools.assert_equal((cache.hits, cache.misses), (0, 1))
+        nose.tools.assert_equal(cache.nbytes, loaded.nbytes)
+        loaded = loadImageFile(img_files[0], cache=cache)
+        nose.tools.assert_equal((cache.hits, cache.misses), (1, 1))
+        nose.tools.assert_equal(loaded.image.width(), 1210)
+
+        # changed files are read again
+        os.utime(img_files[0], (0, 0))
+        loadImageFile(img_files[0], cache=cache)
+        nose.tools.assert_equal((cache.hits, cache.misses), (1, 2))
+
+        # the least recently used image is evicted
+        cache.budget = 2 * loaded.nbytes
+        loadImageFile(img_files[1], cache=cache)
+        loadImageFile(img_files[0], cache=cache)
+        loadImageFile(img_files[2], cache=cache)
+        nose.tools.assert_is_none(cache.get(img_files[1]))
+        nose.tools.assert_is_not_none(cache.get(img_files[0]))
+        nose.tools.assert_less_equal(cache.nbytes, cache.budget)
+
+        # saving the labels of an image does not make it decoded again
+        cache = ImageCache()
+        loaded = loadImageFile(img_files[0], cache=cache)
+        label_file = osp.join(tmp_dir, 'a.json')
+        for i in range(2):
+            LabelFile().save(label_file, [], img_files[0], loaded.imageData,
+                             storeData=False)
+            loaded = loadImageFile(img_files[0], cache=cache)
+            nose.tools.assert_equal(loaded.filename, label_file)
+        nose.tools.assert_equal((cache.hits, cache.misses), (2, 1))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_prefetcher_budget():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication.instance() or QApplication([])
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        img_files = []
+        for name in ['a.jpg', 'b.jpg', 'c.jpg']:
+            img_files.append(osp.join(tmp_dir, name))
+            shutil.copy(osp.join(here, '../static/apc2016_obj3.jpg'),
+                        img_files[-1])
+        nbytes = loadImageFile(img_files[0], cache=ImageCache()).nbytes
+
+        # All three are loaded at once, as none is loaded when they start,
+        # and those wanted last are given up once over budget.
+        prefetcher = Prefetcher(budget=int(1.5 * nbytes), threads=3)
+        prefetcher.prefetch(img_files)
+        prefetcher.waitForDone()
+        app.processEvents()
+        nose.tools.assert_equal(list(prefetcher.loaded), [img_files[0]])
+        nose.tools.assert_equal(prefetcher.nbytes, nbytes)
+        nose.tools.assert_equal(prefetcher.loading, {})
+
+        # Taking one frees the memory for the next.
+        nose.tools.assert_is_not_none(prefetcher.take(img_files[0]))
+        prefetcher.waitForDone()
+        app.processEvents()
+        nose.tools.assert_equal(list(prefetcher.loaded), [img_files[1]])
+    finally:
+        shutil.rmtree(tmp_dir)
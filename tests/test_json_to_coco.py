@@ -0,0 +1,89 @@
+import json
+import os
+import os.path as osp
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import nose
+import numpy as np
+
+from labelme import utils
+
+
+here = osp.dirname(osp.abspath(__file__))
+script = osp.join(here, '../scripts/labelme_json_to_coco')
+
+
+def json_to_coco(tmp_dir, *args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [osp.join(here, '..'), env.get('PYTHONPATH', '')])
+    out_file = osp.join(tmp_dir, 'coco.json')
+    subprocess.check_output(
+        [sys.executable, script, tmp_dir, '-o', out_file, '-j', '2'] +
+        list(args), env=env)
+    with open(out_file) as f:
+        return json.load(f)
+
+
+def test_labelme_json_to_coco():
+    json_file = osp.join(here, '../static/apc2016_obj3.json')
+    with open(json_file) as f:
+        data = json.load(f)
+    img = utils.img_b64_to_array(data['imageData'])
+    height, width = img.shape[:2]
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for name in ['a.json', 'b.json']:
+            shutil.copy(json_file, osp.join(tmp_dir, name))
+
+        for rle in [False, True]:
+            coco = json_to_coco(tmp_dir, *(['--rle'] if rle else []))
+
+            # The image paths are relative to the output file.
+            nose.tools.assert_equal(coco['images'], [
+                dict(id=i + 1, file_name=data['imagePath'],
+                     height=height, width=width)
+                for i in range(2)
+            ])
+
+            # Numbered in the order they are found.
+            labels = [shape['label'] for shape in data['shapes']]
+            nose.tools.assert_equal(
+                coco['categories'],
+                [dict(id=i + 1, name=label, supercategory=None)
+                 for i, label in enumerate(labels)])
+
+            annotations = coco['annotations']
+            nose.tools.assert_equal(len(annotations), 2 * len(labels))
+            for i, ann in enumerate(annotations):
+                shape = data['shapes'][i % len(labels)]
+                nose.tools.assert_equal(ann['id'], i + 1)
+                nose.tools.assert_equal(ann['image_id'],
+                                        i // len(labels) + 1)
+                nose.tools.assert_equal(ann['category_id'],
+                                        i % len(labels) + 1)
+                nose.tools.assert_equal(ann['iscrowd'], 0)
+
+                mask = utils.rle_decode(utils.polygons_to_rle(
+                    (height, width), shape['points']))
+                if rle:
+                    np.testing.assert_array_equal(
+                        utils.rle_decode(ann['segmentation']), mask)
+                else:
+                    nose.tools.assert_equal(
+                        ann['segmentation'],
+                        [[v for point in shape['points'] for v in point]])
+
+                # Area and box are those of the pixels of the mask.
+                nose.tools.assert_equal(ann['area'], mask.sum())
+                ys, xs = np.nonzero(mask)
+                nose.tools.assert_equal(
+                    ann['bbox'], [xs.min(), ys.min(),
+                                  xs.max() - xs.min() + 1,
+                                  ys.max() - ys.min() + 1])
+    finally:
+        shutil.rmtree(tmp_dir)
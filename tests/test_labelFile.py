@@ -0,0 +1,154 @@
+import base64
+import json
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import nose
+import numpy as np
+
+from labelme.binaryLabelFile import BinaryLabelFile
+from labelme.binaryLabelFile import binaryToJson
+from labelme.binaryLabelFile import jsonToBinary
+from labelme.labelFile import LabelFile
+from labelme.labelFile import LabelFileError
+from labelme.labelFile import scanLabelFile
+
+
+here = osp.dirname(osp.abspath(__file__))
+
+
+def _save_and_load(storeData):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        img_file = osp.join(tmp_dir, 'apc2016_obj3.jpg')
+        shutil.copy(osp.join(here, '../static/apc2016_obj3.jpg'), img_file)
+        with open(img_file, 'rb') as f:
+            img_data = f.read()
+        shapes = [dict(label='a', points=[(0, 0), (10, 0), (10, 10)],
+                       line_color=None, fill_color=None, shape_id=0)]
+        label_file = osp.join(tmp_dir, 'label', 'apc2016_obj3.json')
+        os.mkdir(osp.dirname(label_file))
+        LabelFile().save(label_file, shapes, img_file, img_data,
+                         (0, 255, 0, 128), (255, 0, 0, 128),
+                         storeData=storeData,
+                         imageHeight=907, imageWidth=1210)
+        lf = LabelFile(label_file)
+        nose.tools.assert_equal(lf.imageData, img_data)
+        nose.tools.assert_equal(len(list(lf.shapes)), 1)
+        return tmp_dir, label_file, lf
+    except Exception:
+        shutil.rmtree(tmp_dir)
+        raise
+
+
+def test_save_embedded():
+    tmp_dir, _, lf = _save_and_load(storeData=True)
+    shutil.rmtree(tmp_dir)
+
+
+def test_save_nodata():
+    tmp_dir, label_file, lf = _save_and_load(storeData=False)
+    try:
+        nose.tools.assert_equal(lf.imagePath, '../apc2016_obj3.jpg')
+        nose.tools.assert_equal(lf.imageHash,
+                                LabelFile.hashImage(lf.imageData))
+        # the hash known from loading is saved as is
+        lf.save(label_file, [], osp.join(tmp_dir, 'apc2016_obj3.jpg'),
+                lf.imageData, storeData=False, imageHash='sha1:0')
+        nose.tools.assert_equal(json.load(open(label_file))['imageHash'],
+                                'sha1:0')
+        nose.tools.assert_equal(lf.imageHash, 'sha1:0')
+        lf.save(label_file, [], osp.join(tmp_dir, 'apc2016_obj3.jpg'),
+                lf.imageData, storeData=False)
+        # the image changed since the labels were made
+        with open(osp.join(tmp_dir, 'apc2016_obj3.jpg'), 'ab') as f:
+            f.write(b'\0')
+        nose.tools.assert_raises(LabelFileError, LabelFile, label_file)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_scan_label_file():
+    json_file = osp.join(here, '../static/apc2016_obj3.json')
+    data = json.load(open(json_file))
+    for chunk_size in [7, 1 << 20]:
+        data_scan, span = scanLabelFile(json_file, chunkSize=chunk_size)
+        nose.tools.assert_is_none(data_scan['imageData'])
+        nose.tools.assert_equal(data_scan['shapes'], data['shapes'])
+        nose.tools.assert_equal(
+            LabelFile.readImageData(json_file, *span),
+            base64.b64decode(data['imageData']))
+
+    # keys after the image data, with a string that looks like base64, and
+    # image data that is not plain base64
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        label_file = osp.join(tmp_dir, 'a.json')
+        for image_data in [data['imageData'], 'not base64']:
+            with open(label_file, 'w') as f:
+                f.write('{"shapes": [], "imageData": "%s", "imagePath": '
+                        '"%s", "imageHeight": 1}' % (image_data, 'A' * 100))
+            for chunk_size in [7, 1 << 20]:
+                data_scan, span = scanLabelFile(label_file,
+                                                chunkSize=chunk_size)
+                nose.tools.assert_equal(
+                    data_scan, dict(shapes=[], imageData=None,
+                                    imagePath='A' * 100, imageHeight=1))
+                with open(label_file) as f:
+                    f.seek(span[0])
+                    nose.tools.assert_equal(f.read(span[1]), image_data)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_load_lazy():
+    tmp_dir, label_file, lf = _save_and_load(storeData=True)
+    try:
+        lf_lazy = LabelFile(label_file, lazy=True)
+        nose.tools.assert_is_none(lf_lazy._imageData)
+        nose.tools.assert_equal(lf_lazy.imageData, lf.imageData)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_binary_label_file():
+    for storeData in [True, False]:
+        tmp_dir, label_file, lf = _save_and_load(storeData=storeData)
+        try:
+            data = json.load(open(label_file))
+            bin_file = jsonToBinary(label_file)
+            lf_bin = BinaryLabelFile(bin_file)
+            nose.tools.assert_equal(lf_bin.imageData, lf.imageData)
+            nose.tools.assert_equal(lf_bin.points.dtype, np.float64)
+            nose.tools.assert_equal(len(list(lf_bin.shapes)), 1)
+            os.remove(label_file)
+            binaryToJson(bin_file)
+            nose.tools.assert_equal(json.load(open(label_file)), data)
+
+            # relative image paths are made relative to the new file
+            os.makedirs(osp.join(tmp_dir, 'sub', 'dir'))
+            sub_file = osp.join(tmp_dir, 'sub', 'dir', 'a.lbl')
+            jsonToBinary(label_file, sub_file)
+            nose.tools.assert_equal(
+                BinaryLabelFile(sub_file, lazy=True).imagePath,
+                osp.join('..', '..', 'apc2016_obj3.jpg') if not storeData
+                else data['imagePath'])
+            json_file = osp.join(osp.dirname(label_file), 'b.json')
+            binaryToJson(sub_file, json_file)
+            nose.tools.assert_equal(json.load(open(json_file)), data)
+
+            # non-integer points are kept as they are, and the file can be
+            # saved over while loaded
+            shapes = [dict(label='a', points=[(0.1, 0.2), (10.3, 0.7),
+                                              (10.5, 10.25)],
+                           line_color=None, fill_color=None, shape_id=0)]
+            img_file = osp.join(tmp_dir, 'apc2016_obj3.jpg')
+            lf_bin.save(bin_file, shapes, img_file, lf.imageData,
+                        storeData=storeData)
+            nose.tools.assert_equal(list(BinaryLabelFile(bin_file).shapes),
+                                    [('a', [[0.1, 0.2], [10.3, 0.7],
+                                            [10.5, 10.25]], None, None, 0)])
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,77 @@
+import random
+
+import nose
+
+try:
+    from PyQt5.QtCore import QPointF
+    from PyQt5.QtGui import QPainterPath
+except ImportError:
+    from PyQt4.QtCore import QPointF
+    from PyQt4.QtGui import QPainterPath
+
+from labelme.lib import distance
+from labelme.shape import Shape
+
+
+def _shape(points):
+    shape = Shape(label='a')
+    for x, y in points:
+        shape.addPoint(QPointF(x, y))
+    return shape
+
+
+def _path(points):
+    path = QPainterPath()
+    path.moveTo(points[0])
+    for p in points[1:]:
+        path.lineTo(p)
+    return path
+
+
+def test_invalidate():
+    shape = _shape([(0, 0), (10, 0), (10, 10)])
+    nose.tools.assert_equal(shape.boundingRect().width(), 10)
+    edits = [
+        lambda: shape.addPoint(QPointF(20, 20)),
+        lambda: shape.__setitem__(0, QPointF(-5, -5)),
+        lambda: shape.moveVertexBy(1, QPointF(30, 0)),
+        lambda: shape.moveBy(QPointF(1, 1)),
+        lambda: shape.popPoint(),
+    ]
+    for edit in edits:
+        version = shape.version
+        edit()
+        nose.tools.assert_greater(shape.version, version)
+        nose.tools.assert_equal(shape.boundingRect(),
+                                _path(shape.points).boundingRect())
+
+
+def test_cached_geometry():
+    rand = random.Random(0)
+    for _ in range(20):
+        shape = _shape([(rand.uniform(0, 100), rand.uniform(0, 100))
+                        for _ in range(rand.randint(3, 8))])
+        shape.moveVertexBy(0, QPointF(rand.uniform(-5, 5), 0))
+        path = _path(shape.points)
+        for _ in range(50):
+            point = QPointF(rand.uniform(-10, 110), rand.uniform(-10, 110))
+            nose.tools.assert_equal(shape.containsPoint(point),
+                                    path.contains(point))
+            epsilon = rand.uniform(0, 30)
+            expected = None
+            for i, p in enumerate(shape.points):
+                if distance(p - point) <= epsilon:
+                    expected = i
+                    break
+            nose.tools.assert_equal(shape.nearestVertex(point, epsilon),
+                                    expected)
+
+
+def test_geometry_copies():
+    shape = _shape([(0, 0), (10, 0), (10, 10)])
+    shape.makePath().lineTo(100, 100)
+    shape.fillPath().lineTo(100, 100)
+    shape.boundingRect().setWidth(100)
+    nose.tools.assert_equal(shape.boundingRect().width(), 10)
+    nose.tools.assert_equal(shape.makePath().boundingRect().width(), 10)
+    nose.tools.assert_equal(shape.fillPath().boundingRect().width(), 10)
@@ -0,0 +1,101 @@
+import random
+
+import nose
+
+try:
+    from PyQt5.QtCore import QPointF
+except ImportError:
+    from PyQt4.QtCore import QPointF
+
+from labelme.shape import Shape
+from labelme.shapeIndex import ShapeIndex
+
+
+def _shape(points):
+    shape = Shape(label='a')
+    for x, y in points:
+        shape.addPoint(QPointF(x, y))
+    return shape
+
+
+def _box(x, y, w, h):
+    return _shape([(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
+
+
+def test_insert_update_remove():
+    a = _box(10, 10, 20, 20)
+    b = _box(300, 300, 20, 20)
+    index = ShapeIndex([a, b])
+    nose.tools.assert_equal(len(index), 2)
+    nose.tools.assert_equal(index.queryPoint(QPointF(15, 15)), [a])
+    nose.tools.assert_equal(index.queryPoint(QPointF(310, 310)), [b])
+
+    # moved to the other shape's cell, keeping its z-order
+    a.moveBy(QPointF(290, 290))
+    index.update(a)
+    nose.tools.assert_equal(index.queryPoint(QPointF(15, 15)), [])
+    nose.tools.assert_equal(index.queryPoint(QPointF(310, 310)), [b, a])
+
+    index.remove(a)
+    nose.tools.assert_not_in(a, index)
+    nose.tools.assert_equal(index.queryPoint(QPointF(310, 310)), [b])
+    index.remove(a)
+    nose.tools.assert_equal(len(index), 1)
+
+
+def test_update_unchanged_version():
+    a = _box(10, 10, 20, 20)
+    index = ShapeIndex([a])
+    # written in place without invalidating: the index is not updated
+    a.points[0] = QPointF(500, 500)
+    index.update(a)
+    nose.tools.assert_equal(index.queryPoint(QPointF(15, 15)), [a])
+    nose.tools.assert_equal(index.queryPoint(QPointF(500, 500)), [])
+    a.invalidate()
+    index.update(a)
+    nose.tools.assert_equal(index.queryPoint(QPointF(500, 500)), [a])
+
+
+def test_spanning_and_large_shapes():
+    cell = ShapeIndex.cellSize
+    wide = _box(0, 0, 3 * cell, 10)
+    index = ShapeIndex([wide])
+    for x in [1, cell + 1, 2 * cell + 1, 3 * cell - 1]:
+        nose.tools.assert_equal(index.queryPoint(QPointF(x, 5)), [wide])
+    nose.tools.assert_equal(index.queryPoint(QPointF(5 * cell, 5)), [])
+
+    # more than maxCells cells: always a candidate
+    large = _box(0, 0, 20 * cell, 20 * cell)
+    index.insert(large)
+    nose.tools.assert_in(large, index._large)
+    nose.tools.assert_equal(index.query(-cell, -cell, -cell, -cell),
+                            [large])
+    large.moveBy(QPointF(-19 * cell, -19 * cell))
+    index.update(large)
+    nose.tools.assert_in(large, index._large)
+    large.points = [QPointF(0, 0), QPointF(5, 0), QPointF(5, 5)]
+    index.update(large)
+    nose.tools.assert_not_in(large, index._large)
+    nose.tools.assert_equal(index.queryPoint(QPointF(300, 300)), [])
+
+
+def test_query_point_brute_force():
+    rand = random.Random(0)
+    shapes = [_box(rand.uniform(-100, 900), rand.uniform(-100, 900),
+                   rand.uniform(1, 400), rand.uniform(1, 400))
+              for _ in range(200)]
+    index = ShapeIndex(shapes)
+    for _ in range(300):
+        point = QPointF(rand.uniform(-150, 1050), rand.uniform(-150, 1050))
+        margin = rand.choice([0.0, 2.0, 20.0])
+        expected = [
+            s for s in reversed(shapes)
+            if s.boundingRect().adjusted(-margin, -margin, margin, margin)
+            .contains(point)]
+        found = index.queryPoint(point, margin)
+        # candidates are top-most first, and include every hit
+        nose.tools.assert_equal(
+            [index.zOrder(s) for s in found],
+            sorted([index.zOrder(s) for s in found], reverse=True))
+        nose.tools.assert_equal(
+            [s for s in found if s in expected], expected)
@@ -0,0 +1,53 @@
+import os
+
+import nose
+
+try:
+    from PyQt5.QtCore import QRectF
+    from PyQt5.QtGui import QColor, QImage, QPainter
+    from PyQt5.QtWidgets import QApplication
+except ImportError:
+    from PyQt4.QtCore import QRectF
+    from PyQt4.QtGui import QApplication, QColor, QImage, QPainter
+
+from labelme.tiledImage import TiledImage
+
+
+def test_draw():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication.instance() or QApplication([])  # NOQA
+
+    # not a multiple of the tile size
+    image = QImage(600, 600, QImage.Format_RGB32)
+    image.fill(QColor(255, 255, 255))
+    tiled = TiledImage(image)
+    tile = tiled.tile(0, 1, 1)
+    nose.tools.assert_equal((tile.width(), tile.height()), (88, 88))
+
+    target = QImage(800, 800, QImage.Format_ARGB32)
+    target.fill(0)
+    painter = QPainter(target)
+    tiled.draw(painter, QRectF(0, 0, 800, 800), 1)
+    painter.end()
+    nose.tools.assert_equal(target.pixel(0, 0), 0xffffffff)
+    nose.tools.assert_equal(target.pixel(599, 599), 0xffffffff)
+    # nothing is drawn past the edges of the image
+    nose.tools.assert_equal(target.pixel(700, 700), 0)
+    nose.tools.assert_equal(target.pixel(599, 700), 0)
+
+
+def test_build_levels():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    app = QApplication.instance() or QApplication([])  # NOQA
+
+    image = QImage(3000, 1000, QImage.Format_RGB32)
+    image.fill(QColor(255, 255, 255))
+    levels = TiledImage.buildLevels(image)
+    nose.tools.assert_equal([(l.width(), l.height()) for l in levels],
+                            [(1500, 500), (750, 250), (375, 125)])
+    # the levels built beforehand are used as they are
+    tiled = TiledImage(image, levels)
+    nose.tools.assert_equal(tiled.levelFor(0.01), len(levels))
+    for n, level in enumerate(levels):
+        nose.tools.assert_equal(tiled.level(n + 1).cacheKey(),
+                                level.cacheKey())
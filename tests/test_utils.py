@@ -1,5 +1,10 @@
+import base64
 import json
 import os.path as osp
+import shutil
+import subprocess
+import sys
+import tempfile
 
 import nose
 import numpy as np
@@ -17,3 +22,143 @@ def test_img_b64_to_array():
     img = utils.img_b64_to_array(img_b64)
     nose.tools.assert_equal(img.dtype, np.uint8)
     nose.tools.assert_equal(img.shape, (907, 1210, 3))
+
+
+def test_img_data_to_array():
+    json_file = osp.join(here, '../static/apc2016_obj3.json')
+    data = json.load(open(json_file))
+    img_data = base64.b64decode(data['imageData'])
+    img = utils.img_data_to_array(img_data)
+    nose.tools.assert_equal(img.shape, (907, 1210, 3))
+    nose.tools.assert_true(img.flags.writeable)
+    thumb = utils.img_data_to_array(img_data, draft=(300, 200))
+    nose.tools.assert_equal(thumb.shape, (227, 303, 3))
+
+
+def test_label_colormap():
+    cmap = utils.label_colormap(N=21)
+    nose.tools.assert_equal(cmap.shape, (21, 3))
+    nose.tools.assert_equal(cmap.dtype, np.float32)
+    np.testing.assert_array_equal(
+        (cmap[:3] * 255).astype(np.uint8), [[0, 0, 0], [128, 0, 0], [0, 128, 0]])
+    # Each call returns a copy that can be modified.
+    cmap[0] = 1
+    nose.tools.assert_not_equal(utils.label_colormap(N=21)[0, 0], 1)
+
+
+def test_label2rgb():
+    lbl = np.array([[0, 1], [2, -1]], dtype=np.int32)
+    img = np.full((2, 2, 3), 100, dtype=np.uint8)
+    lbl_viz = utils.label2rgb(lbl, img, alpha=0.5)
+    nose.tools.assert_equal(lbl_viz.dtype, np.uint8)
+    np.testing.assert_array_equal(
+        lbl_viz, [[[50, 50, 50], [114, 50, 50]], [[50, 114, 50], [50, 50, 50]]])
+
+
+def test_draw_label():
+    json_file = osp.join(here, '../static/apc2016_obj3.json')
+    data = json.load(open(json_file))
+    img = utils.img_b64_to_array(data['imageData'])
+    lbl, lbl_names = utils.labelme_shapes_to_label(img.shape, data['shapes'])
+    viz = utils.draw_label(lbl, img, lbl_names)
+    nose.tools.assert_equal(viz.dtype, np.uint8)
+    nose.tools.assert_equal(viz.shape, img.shape)
+
+
+def test_shapes_to_label():
+    shapes = [dict(label='a', points=[(0, 0), (5, 0), (5, 5), (0, 5)]),
+              dict(label='b', points=[(3, 3), (8, 3), (8, 8), (3, 8)])]
+    cls, ins = utils.shapes_to_label(
+        (10, 10), shapes, {'background': 0, 'a': 1, 'b': 2}, instance=True)
+    nose.tools.assert_equal((cls.dtype, ins.dtype), (np.int32, np.int32))
+    nose.tools.assert_true(cls.flags.writeable and ins.flags.writeable)
+    nose.tools.assert_equal(cls[1, 1], 1)
+    nose.tools.assert_equal(cls[4, 4], 2)
+    nose.tools.assert_equal(cls[9, 9], 0)
+    np.testing.assert_array_equal(ins > 0, cls > 0)
+    nose.tools.assert_equal(ins[4, 4], 2)
+
+
+def test_polygons_to_mask_roi():
+    polygons = [(10, 20), (30, 20), (30, 25), (10, 25)]
+    mask, x0, y0 = utils.polygons_to_mask_roi((100, 200), polygons)
+    nose.tools.assert_equal((x0, y0), (10, 20))
+    nose.tools.assert_equal(mask.shape, (6, 21))
+    nose.tools.assert_true(mask.all())
+    full = utils.polygons_to_mask((100, 200), polygons)
+    nose.tools.assert_equal(full.sum(), mask.sum())
+    # clipped to the image
+    mask, x0, y0 = utils.polygons_to_mask_roi(
+        (100, 200), [(-10, -10), (5, -10), (5, 5), (-10, 5)])
+    nose.tools.assert_equal((x0, y0, mask.shape), (0, 0, (6, 6)))
+
+    # The box covers the whole full frame mask, which may differ from the
+    # box mask by a boundary pixel.
+    random_state = np.random.RandomState(0)
+    for _ in range(200):
+        polygons = random_state.uniform(-5, 45, (5, 2))
+        full = utils.polygons_to_mask((40, 40), polygons)
+        mask, x0, y0 = utils.polygons_to_mask_roi((40, 40), polygons)
+        nose.tools.assert_equal(
+            full[y0:y0 + mask.shape[0], x0:x0 + mask.shape[1]].sum(),
+            full.sum())
+        nose.tools.assert_less_equal(
+            (full[y0:y0 + mask.shape[0], x0:x0 + mask.shape[1]] !=
+             mask).sum(), 2)
+
+
+def test_polygons_to_rle():
+    polygons = [(2, 1), (6, 1), (6, 4), (2, 4)]
+    rle = utils.polygons_to_rle((5, 8), polygons)
+    nose.tools.assert_equal(rle['size'], [5, 8])
+    mask = utils.rle_decode(rle)
+    expected = np.zeros((5, 8), dtype=bool)
+    expected[1:4, 2:6] = True
+    np.testing.assert_array_equal(mask, expected)
+    nose.tools.assert_equal(utils.rle_encode(mask), rle)
+    nose.tools.assert_equal(utils.rle_area(rle), 12)
+    nose.tools.assert_equal(utils.rle_to_bbox(rle), [2, 1, 4, 3])
+    rle_str = utils.polygons_to_rle((5, 8), polygons, compress=True)
+    np.testing.assert_array_equal(utils.rle_decode(rle_str), expected)
+
+
+def test_find_label_files():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        shutil.copy(osp.join(here, '../static/apc2016_obj3.json'),
+                    osp.join(tmp_dir, 'a.json'))
+        with open(osp.join(tmp_dir, 'coco.json'), 'w') as f:
+            json.dump(dict(images=[], annotations=[]), f)
+        label_files = utils.find_label_files(
+            [tmp_dir], exclude=[osp.join(tmp_dir, 'coco.json')])
+        nose.tools.assert_equal(label_files, [osp.join(tmp_dir, 'a.json')])
+        nose.tools.assert_equal(
+            utils.find_label_files([osp.join(tmp_dir, '*.png')]), [])
+
+        # files that are not label files are skipped
+        converter = utils.LabelFileConverter(utils.load_label_file)
+        results = list(converter.run([(osp.join(tmp_dir, 'a.json'),),
+                                      (osp.join(tmp_dir, 'coco.json'),)]))
+        nose.tools.assert_equal(len(results), 1)
+        nose.tools.assert_equal(
+            converter.counts, dict(converted=1, skipped=1, failed=0))
+        nose.tools.assert_true(converter.summarize())
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_import_time():
+    # Run in a new interpreter, for a cold import.
+    code = (
+        'import sys, time\n'
+        't = time.time()\n'
+        'import labelme.utils\n'
+        'print(time.time() - t)\n'
+        'print(sorted(m for m in sys.modules\n'
+        '             if m.split(".")[0] in ("PIL", "matplotlib", "scipy")))\n'
+    )
+    out = subprocess.check_output([sys.executable, '-c', code],
+                                  cwd=osp.join(here, '..'))
+    elapsed, modules = out.decode('utf-8').splitlines()
+    nose.tools.assert_equal(modules, '[]')
+    nose.tools.assert_less(float(elapsed), 1.0)